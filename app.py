@@ -1,18 +1,26 @@
 import os
+import asyncio
+import re
+import threading
+import time
+import functools
+import hashlib
+from contextlib import contextmanager
 import streamlit as st
-import google.generativeai as genai
+import pandas as pd
 import uuid
-import json
 import firebase_client
+from collections.abc import Mapping
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
 st.set_page_config(page_title="Write Wise - AI Content Generator", layout="wide", page_icon="✍️")
 
 
-def _ensure_firebase_config_from_secrets():
-    """Populate environment variables from Streamlit secrets if available."""
-    firebase_env_keys = [
+@st.cache_resource
+def _ensure_firebase_config_from_secrets() -> bool:
+    """Populate environment variables from Streamlit secrets once per process."""
+    firebase_env_keys = (
         "FIREBASE_API_KEY",
         "FIREBASE_AUTH_DOMAIN",
         "FIREBASE_DATABASE_URL",
@@ -20,25 +28,25 @@ def _ensure_firebase_config_from_secrets():
         "FIREBASE_STORAGE_BUCKET",
         "FIREBASE_MESSAGING_SENDER_ID",
         "FIREBASE_APP_ID",
-    ]
+    )
 
-    secrets_sources = [st.secrets]
-    if "firebase" in st.secrets and isinstance(st.secrets["firebase"], dict):
-        secrets_sources.append(st.secrets["firebase"])
+    nested = st.secrets.get("firebase")
+    sources = (st.secrets, nested) if isinstance(nested, Mapping) else (st.secrets,)
 
     updated = False
     for key in firebase_env_keys:
-        value = None
-        for source in secrets_sources:
-            if key in source:
-                value = source[key]
-                break
+        value = next((source[key] for source in sources if key in source), None)
         if value is not None and os.environ.get(key) != str(value):
             os.environ[key] = str(value)
             updated = True
 
     if updated:
-        firebase_client.client = firebase_client.FirebaseClient()
+        firebase_client.set_client(firebase_client.FirebaseClient())
+    # Initialize on the script thread so configuration warnings reach this run's log,
+    # then open the database connection while the user is still on the login form
+    firebase_client.is_configured()
+    threading.Thread(target=firebase_client.warmup, daemon=True).start()
+    return updated
 
 
 _ensure_firebase_config_from_secrets()
@@ -51,39 +59,155 @@ if not GEMINI_API_KEY:
     st.error("GEMINI_API_KEY not found in Streamlit secrets.")
     st.stop()
 
-genai.configure(api_key=GEMINI_API_KEY)
+
+@functools.lru_cache(maxsize=None)
+def _genai():
+    """Import and configure the Gemini SDK on first use."""
+    import google.generativeai as genai
+
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _get_model(model_name: str, system_instruction: str):
+    """Build a Gemini model once per (model, system prompt) and reuse it across reruns."""
+    return _genai().GenerativeModel(
+        model_name=model_name,
+        system_instruction=system_instruction
+    )
+
+
+def _chunk_text(chunk) -> str:
+    """Extract the text carried by one (streamed) Gemini response chunk."""
+    parts_buf = []
+    if hasattr(chunk, "candidates") and chunk.candidates:
+        for candidate in chunk.candidates:
+            content = getattr(candidate, "content", None)
+            if content and getattr(content, "parts", None):
+                for part in content.parts:
+                    parts_buf.append(getattr(part, "text", ""))
+    if not parts_buf:
+        try:
+            return chunk.text or ""
+        except (AttributeError, ValueError):
+            return ""
+    return "".join(parts_buf)
+
+
+def _structured_prompt(main_topic: str, custom_prompt_input: str, additional_context: str,
+                       sections: Sequence[str]) -> str:
+    """Build the whole-document prompt for a selected structure."""
+    prompt_parts = [f"Topic: {main_topic}\n\n"]
+    if custom_prompt_input:
+        prompt_parts.append(f"Prompt: {custom_prompt_input}\n\n")
+    if additional_context:
+        prompt_parts.append(f"Context: {additional_context}\n\n")
+    prompt_parts.append("Please generate comprehensive content for the following document structure:\n\n")
+    prompt_parts.extend(f"{i}. {section}\n" for i, section in enumerate(sections, 1))
+    return "".join(prompt_parts)
+
+
+def _section_prompt(main_topic: str, section: str, additional_context: str, custom_prompt_input: str) -> str:
+    """Build the generation prompt for a single document section."""
+    if custom_prompt_input:
+        user_requirements = f"User Requirements/Prompt: {custom_prompt_input}\n\n"
+    else:
+        user_requirements = ""
+
+    return (
+        f"Topic: {main_topic}\n\n"
+        f"{user_requirements}"
+        f"Section to generate: {section}\n\n"
+        f"Context: {additional_context}\n\n"
+        "Please generate detailed, comprehensive content specifically for this section. "
+        "Ensure the response reflects the user's requirements and stays tightly aligned with the section focus."
+    )
+
+
+SECTION_BATCH_SIZE = 10
+
+
+@st.cache_resource(show_spinner=False)
+def _async_loop() -> asyncio.AbstractEventLoop:
+    """A long-lived event loop thread; the SDK's async client stays bound to one loop."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+async def _generate_sections_async(model, section_prompts: Sequence[str]) -> list:
+    """Generate a batch of sections concurrently; failed calls come back as exceptions."""
+    responses = await asyncio.gather(
+        *(
+            model.generate_content_async(
+                section_prompt,
+                generation_config={
+                    "max_output_tokens": 8000,
+                    "temperature": 0.35
+                },
+            )
+            for section_prompt in section_prompts
+        ),
+        return_exceptions=True,
+    )
+    return [response if isinstance(response, Exception) else _chunk_text(response) for response in responses]
+
+
+GENERATION_CACHE_SIZE = 16
+
+
+def _generation_key(model_name: str, system_prompt: str, user_prompt: str) -> str:
+    """Hash everything that determines a generation's output."""
+    return hashlib.sha256("\x1f".join((model_name, system_prompt, user_prompt)).encode("utf-8")).hexdigest()
+
+
+def _remember_generation(cache_key: str, output_text: str) -> None:
+    """Keep the most recent outputs for this session, evicting the oldest."""
+    cache = st.session_state.generation_cache
+    cache.pop(cache_key, None)
+    cache[cache_key] = output_text
+    while len(cache) > GENERATION_CACHE_SIZE:
+        cache.pop(next(iter(cache)))
+
+
+def _stream_markdown(response, placeholder) -> str:
+    """Render a streamed Gemini response into ``placeholder`` as it arrives and return the full text."""
+    buffer = []
+    for chunk in response:
+        text = _chunk_text(chunk)
+        if text:
+            buffer.append(text)
+            placeholder.markdown("".join(buffer))
+    return "".join(buffer)
 
 # ------------------------------
 # Initialize Session State
 # ------------------------------
-if "user" not in st.session_state:
-    st.session_state.user = None
+_SESSION_DEFAULTS = {
+    "user": None,
+    "do_not_store": False,
+    "current_page": "generator",
+    "selected_template": None,
+    "custom_sections": None,
+    "main_topic": None,
+    "additional_context": None,
+    "generation_mode": None,
+    "persistent_session_token": None,
+    "persistent_session_checked": False,
+    "structure_selection_message": None,
+    "last_output_timestamp": None,
+}
+
+for _key, _value in _SESSION_DEFAULTS.items():
+    st.session_state.setdefault(_key, _value)
+# Defaults that are per-session objects or derived from other keys
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
-if "do_not_store" not in st.session_state:
-    st.session_state.do_not_store = False
-if "private_session_enabled" not in st.session_state:
-    st.session_state.private_session_enabled = st.session_state.do_not_store
-if "current_page" not in st.session_state:
-    st.session_state.current_page = "generator"
-if "selected_template" not in st.session_state:
-    st.session_state.selected_template = None
-if "custom_sections" not in st.session_state:
-    st.session_state.custom_sections = None
-if "main_topic" not in st.session_state:
-    st.session_state.main_topic = None
-if "additional_context" not in st.session_state:
-    st.session_state.additional_context = None
-if "section_results" not in st.session_state:
-    st.session_state.section_results = {}
-if "generation_mode" not in st.session_state:
-    st.session_state.generation_mode = None
-if "persistent_session_token" not in st.session_state:
-    st.session_state.persistent_session_token = None
-if "persistent_session_checked" not in st.session_state:
-    st.session_state.persistent_session_checked = False
-if "structure_selection_message" not in st.session_state:
-    st.session_state.structure_selection_message = None
+st.session_state.setdefault("private_session_enabled", st.session_state.do_not_store)
+st.session_state.setdefault("section_results", {})
+st.session_state.setdefault("pending_writes", [])
+st.session_state.setdefault("generation_cache", {})
 
 def _get_query_param(name: str) -> Optional[str]:
     value = st.query_params.get(name)
@@ -106,13 +230,34 @@ def _remove_query_param(name: str) -> None:
         pass
 
 
+def _user_snapshot() -> Tuple[Optional[dict], bool, Optional[str]]:
+    """Read the signed-in user once and derive the guest flag and user ID."""
+    user = st.session_state.user
+    is_guest = bool(user and user.get("guest"))
+    user_id = (user.get("uid") or user.get("$id")) if user and not is_guest else None
+    return user, is_guest, user_id
+
+
+def _surface_firebase_warning() -> None:
+    """Display any pending Firebase warnings to the user."""
+    for message in firebase_client.drain_errors():
+        st.warning(message)
+
+
+@contextmanager
+def _fb_errors():
+    """Surface Firebase warnings raised anywhere in the block once it exits."""
+    try:
+        yield
+    finally:
+        _surface_firebase_warning()
+
+
 if not st.session_state.user and not st.session_state.persistent_session_checked:
     session_token = _get_query_param("session")
     if session_token:
-        restored_user, message = firebase_client.resume_session(session_token)
-        warning_msg = firebase_client.pop_last_error()
-        if warning_msg:
-            st.warning(warning_msg)
+        with _fb_errors():
+            restored_user, message = firebase_client.resume_session(session_token)
         if restored_user:
             st.session_state.user = restored_user
             st.session_state.persistent_session_token = session_token
@@ -124,16 +269,91 @@ if not st.session_state.user and not st.session_state.persistent_session_checked
     st.session_state.persistent_session_checked = True
 
 
-def _surface_firebase_warning() -> None:
-    """Display any pending Firebase warning to the user."""
-    message = firebase_client.pop_last_error()
-    if message:
-        st.warning(message)
+@functools.lru_cache(maxsize=8192)
+def _format_timestamp(timestamp: float, fmt: str = "%Y-%m-%d %H:%M") -> str:
+    """Format an epoch timestamp for display, returning "" when it is invalid."""
+    try:
+        return datetime.fromtimestamp(timestamp).strftime(fmt)
+    except Exception:
+        return ""
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_messages_by_session(user_id: str, session_ids: Tuple[str, ...]) -> Dict[str, List[dict]]:
+    """Fetch messages for all listed sessions in one batched read."""
+    return firebase_client.get_messages_bulk(list(session_ids), user_id=user_id)
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_list_sessions(user_id: str) -> List[dict]:
+    """List a user's sessions, reusing the result across reruns."""
+    return firebase_client.list_sessions(user_id)
+
+
+_SLUG_TABLE = str.maketrans({" ": "_", "/": "_", "\\": "_"})
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_list_templates(user_id: str, include_public: bool) -> List[dict]:
+    """List a user's templates, reusing the result across reruns."""
+    templates = firebase_client.list_templates(user_id, include_public=include_public)
+    for template in templates:
+        # Lowercased search text, built once per fetch instead of per keystroke
+        template["_haystack"] = "\x1f".join((
+            template.get("template_name") or "",
+            template.get("description") or "",
+            " ".join(template.get("sections", [])),
+        )).lower()
+        template["_slug"] = (template.get("template_name") or "").translate(_SLUG_TABLE).lower() or "template"
+    return templates
+
+
+def _template_download_json(template: dict) -> str:
+    """Serialize a template for download, leaving out UI-only fields."""
+    import json
+
+    return json.dumps({key: value for key, value in template.items() if not key.startswith("_")}, indent=2)
+
+
+def _invalidate_history_cache() -> None:
+    """Drop cached session listings and messages after history changes."""
+    _cached_list_sessions.clear()
+    _cached_messages_by_session.clear()
+
+
+def _queue_message(role: str, content: str, metadata: Optional[dict] = None) -> None:
+    """Buffer a chat message for the current session until _flush_messages runs."""
+    if st.session_state.do_not_store:
+        return
+    st.session_state.pending_writes.append((role, content, metadata, int(time.time())))
+
+
+def _flush_messages(user_id: Optional[str]) -> None:
+    """Write all buffered messages in one batch and refresh the history listings."""
+    pending = st.session_state.pending_writes
+    if not pending:
+        return
+    st.session_state.pending_writes = []
+    try:
+        firebase_client.save_messages(
+            st.session_state.session_id,
+            pending,
+            user_id=user_id,
+            do_not_store=st.session_state.do_not_store
+        )
+    except Exception:
+        pass
+    _invalidate_history_cache()
+
+
+def _mark_messages_loaded(session_id: str) -> None:
+    """Remember that the user asked to see a session's messages."""
+    st.session_state[f"msgs_loaded_{session_id}"] = True
 
 # ------------------------------
 # Example Structure Templates
 # ------------------------------
-EXAMPLE_STRUCTURES = {
+EXAMPLE_STRUCTURES = {name: tuple(sections) for name, sections in {
     "Research Report": [
         "Introduction",
         "Research Methodology",
@@ -186,7 +406,18 @@ EXAMPLE_STRUCTURES = {
         "Risk Analysis",
         "Conclusion"
     ]
-}
+}.items()}
+
+
+def _numbered_markdown(sections: Sequence[str]) -> str:
+    """Render sections as a single numbered markdown list."""
+    return "\n".join(f"{i}. {section}" for i, section in enumerate(sections, 1))
+
+
+@st.cache_data(show_spinner=False)
+def _rendered_example_structures() -> Dict[str, str]:
+    """Pre-render the numbered section list for each example structure."""
+    return {name: _numbered_markdown(sections) for name, sections in EXAMPLE_STRUCTURES.items()}
 
 # ------------------------------
 # Theme/Tone Presets
@@ -198,6 +429,7 @@ TONE_PRESETS = {
     "Marketing": "Use persuasive, benefit-focused language. Create urgency, highlight value propositions, and include calls to action.",
     "Casual": "Use friendly, approachable language. Keep it simple and relatable.",
 }
+TONE_CHOICES = tuple(TONE_PRESETS)
 
 # ------------------------------
 # Output Format Options
@@ -208,6 +440,41 @@ FORMAT_OPTIONS = {
     "Tabular": "Present information in structured tables when appropriate, with clear columns and rows.",
     "Mixed": "Use a combination of paragraphs, lists, and tables as appropriate for the content.",
 }
+FORMAT_CHOICES = tuple(FORMAT_OPTIONS)
+
+# ------------------------------
+# Model Options
+# ------------------------------
+MODEL_OPTIONS = ("gemini-2.5-flash", "gemini-2.5-pro")
+
+# ------------------------------
+# Content Depth Options
+# ------------------------------
+DEPTH_INSTRUCTIONS = {
+    "Shallow (high-level overview)": "Provide a clear and simple overview. Focus on key points, avoid unnecessary details.",
+    "Medium (moderate detail with examples)": "Provide a moderately detailed explanation with examples and supporting points.",
+    "Deep (very detailed, nuanced, in-depth analysis)": "Provide an in-depth, thorough, and nuanced explanation. Include examples, multiple perspectives, reasoning, and insights."
+}
+DEPTH_CHOICES = tuple(DEPTH_INSTRUCTIONS)
+
+SECTION_TASK = "Generate high-quality content for this specific section. Focus on relevance, clarity, and completeness."
+DOCUMENT_TASK = """Your task is to generate high-quality content based on the user's prompt.
+Use proper grammar and structure, adapt tone appropriately, include headings or examples if needed, and avoid filler or repetition."""
+
+
+@st.cache_data(show_spinner=False)
+def _assemble_system_prompt(base_system_instruction: str, depth_choice: str, tone_choice: str,
+                            format_choice: str, task: str) -> str:
+    """Combine the base instruction with the selected depth, tone and format presets."""
+    return f"""
+{base_system_instruction}
+
+CONTENT DEPTH: {DEPTH_INSTRUCTIONS[depth_choice]}
+TONE & STYLE: {TONE_PRESETS[tone_choice]}
+OUTPUT FORMAT: {FORMAT_OPTIONS[format_choice]}
+
+{task}
+"""
 
 # ------------------------------
 # Authentication Functions
@@ -233,9 +500,6 @@ def show_auth_page():
                         st.session_state.user = user
                         if st.session_state.persistent_session_token:
                             firebase_client.delete_persistent_session(st.session_state.persistent_session_token)
-                            residual_warning = firebase_client.pop_last_error()
-                            if residual_warning:
-                                st.warning(residual_warning)
                         st.session_state.persistent_session_token = None
 
                         refresh_token = user.get("refresh_token")
@@ -244,9 +508,6 @@ def show_auth_page():
                             refresh_token,
                             metadata={"email": user.get("email")}
                         ) if refresh_token else (None, "")
-                        warning_msg = firebase_client.pop_last_error()
-                        if warning_msg:
-                            st.warning(warning_msg)
 
                         if session_token:
                             st.session_state.persistent_session_token = session_token
@@ -263,9 +524,6 @@ def show_auth_page():
         if st.button("Continue as Guest"):
             if st.session_state.persistent_session_token:
                 firebase_client.delete_persistent_session(st.session_state.persistent_session_token)
-                warning_msg = firebase_client.pop_last_error()
-                if warning_msg:
-                    st.warning(warning_msg)
             st.session_state.persistent_session_token = None
             _remove_query_param("session")
             st.session_state.structure_selection_message = None
@@ -298,6 +556,80 @@ def show_auth_page():
 # ------------------------------
 # History Viewer
 # ------------------------------
+@st.fragment
+def _render_session_card(session: dict, user_id: str) -> None:
+    """Render one history session; its widgets rerun only this card."""
+    session_id = session.get("session_id")
+    title = session.get("title", "Untitled Session")
+    updated_at = session.get("updated_at")
+    created_at = session.get("created_at")
+    message_count = session.get("message_count", 0)
+
+    subtitle_parts = []
+    created_label = _format_timestamp(created_at) if created_at else ""
+    if created_label:
+        subtitle_parts.append(f"Created {created_label}")
+    updated_label = _format_timestamp(updated_at) if updated_at else ""
+    if updated_label:
+        subtitle_parts.append(f"Updated {updated_label}")
+    subtitle = " • ".join(subtitle_parts)
+
+    with st.expander(f"🗂️ {title}"):
+        if subtitle:
+            st.caption(subtitle)
+        st.caption(f"Messages: {message_count}")
+
+        messages = None
+        if st.session_state.get(f"msgs_loaded_{session_id}"):
+            messages = _cached_messages_by_session(user_id, (session_id,)).get(session_id, [])
+            _surface_firebase_warning()
+        if messages is None:
+            st.button(
+                "💬 Show Messages",
+                key=f"show_messages_{session_id}",
+                on_click=_mark_messages_loaded,
+                args=(session_id,),
+            )
+        elif not messages:
+            st.info("No messages stored for this session.")
+        else:
+            for msg in messages:
+                role = (msg.get("role") or "assistant").lower()
+                content = msg.get("content", "")
+                timestamp = msg.get("timestamp")
+                msg_timestamp = _format_timestamp(timestamp) if timestamp else ""
+
+                if role == "user":
+                    speaker = "🧑‍💻 You"
+                    if msg_timestamp:
+                        st.markdown(f"**{speaker}** ({msg_timestamp})")
+                    else:
+                        st.markdown(f"**{speaker}**")
+                    st.info(content)
+                else:
+                    speaker = "🤖 AI"
+                    if msg_timestamp:
+                        st.markdown(f"**{speaker}** ({msg_timestamp})")
+                    else:
+                        st.markdown(f"**{speaker}**")
+                    st.success(content)
+
+        action_col1, action_col2 = st.columns(2)
+        with action_col1:
+            if st.button("📂 Load Session", key=f"load_{session_id}"):
+                st.session_state.session_id = session_id
+                st.session_state.current_page = "generator"
+                st.rerun()
+        with action_col2:
+            if st.button("🗑️ Delete Session", key=f"delete_{session_id}"):
+                if firebase_client.delete_session(session_id, user_id):
+                    _invalidate_history_cache()
+                    st.success(f"Session '{title}' deleted!")
+                    st.rerun()
+                else:
+                    st.error("Failed to delete session")
+
+
 def show_history_page():
     st.title("📚 Session History")
 
@@ -305,11 +637,11 @@ def show_history_page():
         st.warning("History is unavailable because Firebase is not configured.")
         return
 
-    if not st.session_state.user or st.session_state.user.get("guest"):
+    user, is_guest, user_id = _user_snapshot()
+    if not user or is_guest:
         st.info("Login with your Write Wise account to view saved sessions.")
         return
 
-    user_id = st.session_state.user.get("uid") or st.session_state.user.get("$id")
     if not user_id:
         st.error("Unable to determine user ID. Please log out and log in again.")
         return
@@ -318,127 +650,199 @@ def show_history_page():
     with search_col:
         search_term = st.text_input("Search sessions", placeholder="Search by title...", key="history_search_term")
     with export_col:
-        export_data = firebase_client.export_history(user_id)
+        # Stamp the export filename once per visit rather than on every rerun
+        if "history_export_stamp" not in st.session_state:
+            st.session_state.history_export_stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         st.download_button(
             "⬇️ Export JSON",
-            export_data,
-            file_name=f"writewise_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            functools.partial(firebase_client.export_history, user_id),
+            file_name=f"writewise_history_{st.session_state.history_export_stamp}.json",
             mime="application/json",
             key="history_export_button",
         )
     with refresh_col:
         if st.button("🔄 Refresh", key="history_refresh_button"):
+            _invalidate_history_cache()
+            st.session_state.pop("history_export_stamp", None)
             st.rerun()
 
-    sessions = firebase_client.list_sessions(user_id, search_term=search_term or None)
-    _surface_firebase_warning()
+    sessions = _cached_list_sessions(user_id)
+
+    # Filter the cached listing locally so typing doesn't refetch
+    query = (search_term or "").strip().lower()
+    if query:
+        sessions = [session for session in sessions if query in (session.get("title") or "").lower()]
 
     if not sessions:
         st.info("No saved sessions yet. Generate content to build your history.")
         return
 
     for session in sessions:
-        session_id = session.get("session_id")
-        title = session.get("title", "Untitled Session")
-        updated_at = session.get("updated_at")
-        created_at = session.get("created_at")
-        message_count = session.get("message_count", 0)
-
-        subtitle_parts = []
-        if created_at:
-            try:
-                subtitle_parts.append(f"Created {datetime.fromtimestamp(created_at).strftime('%Y-%m-%d %H:%M')}")
-            except Exception:
-                pass
-        if updated_at:
-            try:
-                subtitle_parts.append(f"Updated {datetime.fromtimestamp(updated_at).strftime('%Y-%m-%d %H:%M')}")
-            except Exception:
-                pass
-        subtitle = " • ".join(subtitle_parts)
-
-        with st.expander(f"🗂️ {title}"):
-            if subtitle:
-                st.caption(subtitle)
-            st.caption(f"Messages: {message_count}")
-
-            messages = firebase_client.get_messages(session_id, user_id=user_id)
-            _surface_firebase_warning()
-            if not messages:
-                st.info("No messages stored for this session.")
-            else:
-                for msg in messages:
-                    role = (msg.get("role") or "assistant").lower()
-                    content = msg.get("content", "")
-                    timestamp = msg.get("timestamp")
-                    try:
-                        msg_timestamp = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M") if timestamp else ""
-                    except Exception:
-                        msg_timestamp = ""
-
-                    if role == "user":
-                        speaker = "🧑‍💻 You"
-                        if msg_timestamp:
-                            st.markdown(f"**{speaker}** ({msg_timestamp})")
-                        else:
-                            st.markdown(f"**{speaker}**")
-                        st.info(content)
-                    else:
-                        speaker = "🤖 AI"
-                        if msg_timestamp:
-                            st.markdown(f"**{speaker}** ({msg_timestamp})")
-                        else:
-                            st.markdown(f"**{speaker}**")
-                        st.success(content)
-
-            action_col1, action_col2 = st.columns(2)
-            with action_col1:
-                if st.button("📂 Load Session", key=f"load_{session_id}"):
-                    st.session_state.session_id = session_id
-                    st.session_state.current_page = "generator"
-                    st.rerun()
-            with action_col2:
-                if st.button("🗑️ Delete Session", key=f"delete_{session_id}"):
-                    if firebase_client.delete_session(session_id, user_id):
-                        st.success(f"Session '{title}' deleted!")
-                        st.rerun()
-                    else:
-                        st.error("Failed to delete session")
+        _render_session_card(session, user_id)
 
 # ------------------------------
 # Template Builder
 # ------------------------------
+def _load_structure_into_generator(template_label: str, sections: Sequence[str], *, main_topic: Optional[str] = None, description: str = "") -> None:
+    """Persist the selected structure and cue the user to generate content."""
+    st.session_state.selected_template = template_label or "Custom Structure"
+    # tuple() is a no-op for the frozen example structures and copies anything mutable
+    st.session_state.custom_sections = tuple(sections)
+    st.session_state.main_topic = main_topic or template_label or "Custom Structure"
+    st.session_state.additional_context = description
+    st.session_state.section_results = {}
+    st.session_state.structure_selection_message = (
+        f"Structure '{st.session_state.selected_template}' selected. Open the Generator tab to start creating content."
+    )
+    st.session_state.structured_prompt_input = ""
+    st.rerun()
+
+
+@st.fragment
+def _render_template_card(template: dict, user_id: str) -> None:
+    """Render one saved template; its widgets rerun only this card."""
+    template_id = template.get("template_id", "")
+    template_name = template.get("template_name", "Untitled")
+    description = template.get("description", "")
+    sections = template.get("sections", [])
+    is_public = template.get("is_public", False)
+    is_public_shared = template.get("is_public_shared", False)
+    template_user_id = template.get("user_id", "")
+    updated_at = template.get("updated_at", 0)
+
+    # Determine template type icon
+    if is_public_shared:
+        icon = "🌐"
+        type_label = "Public Template"
+    elif is_public:
+        icon = "🌐"
+        type_label = "Your Public Template"
+    else:
+        icon = "📋"
+        type_label = "Private Template"
+
+    with st.expander(f"{icon} {template_name} - {type_label}"):
+        if description:
+            st.markdown(f"**Description:** {description}")
+        last_updated = _format_timestamp(updated_at, "%Y-%m-%d %H:%M:%S") if updated_at else ""
+        if last_updated:
+            st.caption(f"Last updated: {last_updated}")
+        if is_public_shared and template_user_id:
+            st.caption("Community share")
+
+        # Sections, actions and the edit form are only built once asked for
+        if not st.toggle("Show details", key=f"template_details_{template_id}"):
+            return
+
+        st.markdown(f"**Sections ({len(sections)}):**")
+        st.markdown(_numbered_markdown(sections))
+
+        owner = template_user_id == user_id
+        action_cols = st.columns(4 if owner else 2)
+
+        with action_cols[0]:
+            if st.button(f"✅ Use Template", key=f"use_template_{template_id}"):
+                _load_structure_into_generator(template_name, sections, main_topic=template_name, description=description)
+
+        with action_cols[1]:
+            st.download_button(
+                "⬇️ Download",
+                functools.partial(_template_download_json, template),
+                file_name=f"writewise_template_{template['_slug']}.json",
+                mime="application/json",
+                key=f"download_template_{template_id}"
+            )
+
+        if owner:
+            with action_cols[2]:
+                if st.button(f"🗑️ Delete", key=f"delete_template_{template_id}"):
+                    if firebase_client.delete_template(template_id, user_id):
+                        _cached_list_templates.clear()
+                        st.success(f"Template '{template_name}' deleted!")
+                        _surface_firebase_warning()
+                        st.rerun()
+                    else:
+                        st.error("Failed to delete template")
+                        _surface_firebase_warning()
+
+            with action_cols[3]:
+                new_visibility = "🔒 Make Private" if is_public else "🌐 Make Public"
+                if st.button(new_visibility, key=f"toggle_visibility_{template_id}"):
+                    success, message = firebase_client.update_template(
+                        template_id=template_id,
+                        user_id=user_id,
+                        is_public=not is_public
+                    )
+                    if success:
+                        _cached_list_templates.clear()
+                        st.success(message)
+                        _surface_firebase_warning()
+                        st.rerun()
+                    else:
+                        st.error(message)
+                        _surface_firebase_warning()
+
+            with st.expander("✏️ Edit Template", expanded=False):
+                sections_text = "\n".join(sections)
+                with st.form(f"edit_template_form_{template_id}"):
+                    new_name = st.text_input("Template Name", value=template_name)
+                    new_description = st.text_area("Description", value=description or "", height=100)
+                    new_sections_raw = st.text_area(
+                        "Sections (one per line)",
+                        value=sections_text,
+                        height=160
+                    )
+                    new_public_state = st.checkbox(
+                        "Share publicly",
+                        value=is_public,
+                        help="When enabled, this template is available to other Write Wise users."
+                    )
+                    submitted = st.form_submit_button("Save Changes")
+                    if submitted:
+                        new_sections = [line.strip() for line in new_sections_raw.splitlines() if line.strip()]
+                        if not new_name.strip():
+                            st.error("Template name is required.")
+                        elif not new_sections:
+                            st.error("Please provide at least one section.")
+                        else:
+                            success, message = firebase_client.update_template(
+                                template_id=template_id,
+                                user_id=user_id,
+                                template_name=new_name.strip(),
+                                sections=new_sections,
+                                description=new_description.strip(),
+                                is_public=new_public_state,
+                            )
+                            if success:
+                                _cached_list_templates.clear()
+                                st.success(message)
+                                _surface_firebase_warning()
+                                st.rerun()
+                            else:
+                                st.error(message)
+                                _surface_firebase_warning()
+
+
 def show_template_page():
     st.title("📋 Structure Builder")
     st.markdown("Define your document structure and let AI generate content for each section!")
 
+    user, is_guest, user_id = _user_snapshot()
+
     if st.session_state.structure_selection_message:
         st.success(st.session_state.structure_selection_message)
 
-    def _load_structure_into_generator(template_label: str, sections: List[str], *, main_topic: Optional[str] = None, description: str = "") -> None:
-        """Persist the selected structure and cue the user to generate content."""
-        st.session_state.selected_template = template_label or "Custom Structure"
-        st.session_state.custom_sections = sections.copy()
-        st.session_state.main_topic = main_topic or template_label or "Custom Structure"
-        st.session_state.additional_context = description
-        st.session_state.section_results = {}
-        st.session_state.structure_selection_message = (
-            f"Structure '{st.session_state.selected_template}' selected. Open the Generator tab to start creating content."
-        )
-        st.session_state.structured_prompt_input = ""
-        st.rerun()
-    
     tab1, tab2, tab3 = st.tabs(["Use Example Structures", "Create Custom Structure", "My Saved Templates"])
     
     with tab1:
         st.subheader("Pre-built Structure Templates")
         st.info("💡 Select a template to see example sections, then customize or use as-is")
         
+        rendered_structures = _rendered_example_structures()
         for structure_name, sections in EXAMPLE_STRUCTURES.items():
             with st.expander(f"📄 {structure_name}"):
                 st.markdown("**Sections:**")
-                for i, section in enumerate(sections, 1):
-                    st.markdown(f"{i}. {section}")
+                st.markdown(rendered_structures[structure_name])
 
                 if st.button(f"Open \"{structure_name}\" in Generator", key=f"open_{structure_name}"):
                     _load_structure_into_generator(structure_name, sections, main_topic=structure_name)
@@ -474,27 +878,24 @@ def show_template_page():
         
         # Section input
         st.markdown("### Define Each Section:")
-        custom_sections = []
-        
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            st.markdown("**Section Name**")
-        with col2:
-            st.markdown("**Order**")
-        
-        for i in range(int(num_sections)):
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                section_name = st.text_input(
-                    f"Section {i+1}",
-                    placeholder=f"e.g., Introduction, Methodology, Results...",
-                    key=f"section_{i}",
-                    label_visibility="collapsed"
-                )
-                if section_name.strip():
-                    custom_sections.append(section_name.strip())
-            with col2:
-                st.text(f"{i+1}")
+        section_rows = int(num_sections)
+        section_df = st.data_editor(
+            pd.DataFrame(
+                {"Section Name": [""] * section_rows},
+                index=pd.RangeIndex(1, section_rows + 1, name="Order"),
+            ),
+            num_rows="fixed",
+            use_container_width=True,
+            column_config={
+                "Section Name": st.column_config.TextColumn(
+                    help="e.g., Introduction, Methodology, Results...",
+                ),
+            },
+            key=f"sections_editor_{section_rows}",
+        )
+        custom_sections = [
+            name.strip() for name in section_df["Section Name"] if isinstance(name, str) and name.strip()
+        ]
         
         # Preview
         if custom_sections:
@@ -505,8 +906,7 @@ def show_template_page():
             if description:
                 st.markdown(f"**Description:** {description}")
             st.markdown("**Sections:**")
-            for i, section in enumerate(custom_sections, 1):
-                st.markdown(f"{i}. {section}")
+            st.markdown(_numbered_markdown(custom_sections))
         
         # Save and use buttons
         st.markdown("---")
@@ -518,8 +918,7 @@ def show_template_page():
         
         with col2:
             if st.button("💾 Save Template", disabled=not custom_sections or not main_topic):
-                if st.session_state.user and not st.session_state.user.get("guest"):
-                    user_id = st.session_state.user.get("uid") or st.session_state.user.get("$id")
+                if user and not is_guest:
                     success, message = firebase_client.save_template(
                         user_id=user_id,
                         template_name=main_topic,
@@ -528,20 +927,18 @@ def show_template_page():
                         is_public=False
                     )
                     if success:
+                        _cached_list_templates.clear()
                         st.success(f"✅ {message}")
-                        _surface_firebase_warning()
                     else:
                         st.error(f"❌ {message}")
-                        _surface_firebase_warning()
-                elif not st.session_state.user or st.session_state.user.get("guest"):
+                elif not user or is_guest:
                     st.warning("Please login to save templates")
                 else:
                     st.error("Please define template name and sections")
         
         with col3:
             if st.button("🌐 Save as Public Template", disabled=not custom_sections or not main_topic):
-                if st.session_state.user and not st.session_state.user.get("guest"):
-                    user_id = st.session_state.user.get("uid") or st.session_state.user.get("$id")
+                if user and not is_guest:
                     success, message = firebase_client.save_template(
                         user_id=user_id,
                         template_name=main_topic,
@@ -550,12 +947,11 @@ def show_template_page():
                         is_public=True
                     )
                     if success:
+                        _cached_list_templates.clear()
                         st.success(f"✅ {message} - Shared publicly!")
-                        _surface_firebase_warning()
                     else:
                         st.error(f"❌ {message}")
-                        _surface_firebase_warning()
-                elif not st.session_state.user or st.session_state.user.get("guest"):
+                elif not user or is_guest:
                     st.warning("Please login to save templates")
                 else:
                     st.error("Please define template name and sections")
@@ -563,12 +959,10 @@ def show_template_page():
     with tab3:
         st.subheader("My Saved Templates")
         
-        if not st.session_state.user or st.session_state.user.get("guest"):
+        if not user or is_guest:
             st.warning("Please login to view saved templates")
             return
         
-        user_id = st.session_state.user.get("uid") or st.session_state.user.get("$id")
-        
         filter_col, visibility_col, refresh_col = st.columns([3, 2, 1])
         with filter_col:
             search_term = st.text_input(
@@ -587,11 +981,11 @@ def show_template_page():
             )
         with refresh_col:
             if st.button("🔄 Refresh"):
+                _cached_list_templates.clear()
                 st.rerun()
 
         include_public = any(option in selected_visibility for option in ("Public", "Community"))
-        templates = firebase_client.list_templates(user_id, include_public=include_public)
-        _surface_firebase_warning()
+        templates = _cached_list_templates(user_id, include_public)
 
         if not templates:
             st.info("No saved templates found. Create one in the 'Create Custom Structure' tab!")
@@ -612,21 +1006,15 @@ def show_template_page():
             return "Private"
 
         filtered_templates = []
-        query = (search_term or "").strip().lower()
+        visibility_filter = set(selected_visibility)
+        # Match any whitespace-separated search term in one scan of the haystack
+        tokens = (search_term or "").lower().split()
+        pattern = re.compile("|".join(map(re.escape, tokens))) if tokens else None
         for template in templates:
-            visibility_label = _visibility_label(template)
-            if selected_visibility and visibility_label not in selected_visibility:
+            if visibility_filter and _visibility_label(template) not in visibility_filter:
+                continue
+            if pattern and not pattern.search(template["_haystack"]):
                 continue
-
-            if query:
-                haystacks = [
-                    template.get("template_name", ""),
-                    template.get("description", ""),
-                    " ".join(template.get("sections", [])),
-                ]
-                if not any(query in (value or "").lower() for value in haystacks):
-                    continue
-
             filtered_templates.append(template)
 
         if not filtered_templates:
@@ -643,181 +1031,21 @@ def show_template_page():
 
         # Display templates
         for template in filtered_templates:
-            template_id = template.get("template_id", "")
-            template_name = template.get("template_name", "Untitled")
-            description = template.get("description", "")
-            sections = template.get("sections", [])
-            is_public = template.get("is_public", False)
-            is_public_shared = template.get("is_public_shared", False)
-            template_user_id = template.get("user_id", "")
-            updated_at = template.get("updated_at", 0)
-            
-            # Determine template type icon
-            if is_public_shared:
-                icon = "🌐"
-                type_label = "Public Template"
-            elif is_public:
-                icon = "🌐"
-                type_label = "Your Public Template"
-            else:
-                icon = "📋"
-                type_label = "Private Template"
-            
-            with st.expander(f"{icon} {template_name} - {type_label}"):
-                if description:
-                    st.markdown(f"**Description:** {description}")
-                if updated_at:
-                    try:
-                        last_updated = datetime.fromtimestamp(updated_at).strftime("%Y-%m-%d %H:%M:%S")
-                        st.caption(f"Last updated: {last_updated}")
-                    except Exception:
-                        pass
-                if is_public_shared and template_user_id:
-                    st.caption("Community share")
-                
-                st.markdown(f"**Sections ({len(sections)}):**")
-                for i, section in enumerate(sections, 1):
-                    st.markdown(f"{i}. {section}")
-
-                download_payload = json.dumps(template, indent=2)
-                owner = template_user_id == user_id
-                action_cols = st.columns(4 if owner else 2)
-                
-                with action_cols[0]:
-                    if st.button(f"✅ Use Template", key=f"use_template_{template_id}"):
-                        _load_structure_into_generator(template_name, sections, main_topic=template_name, description=description)
-
-                with action_cols[1]:
-                    st.download_button(
-                        "⬇️ Download",
-                        download_payload,
-                        file_name=f"writewise_template_{template_name.replace(' ', '_').lower() or 'template'}.json",
-                        mime="application/json",
-                        key=f"download_template_{template_id}"
-                    )
-
-                if owner:
-                    with action_cols[2]:
-                        if st.button(f"🗑️ Delete", key=f"delete_template_{template_id}"):
-                            if firebase_client.delete_template(template_id, user_id):
-                                st.success(f"Template '{template_name}' deleted!")
-                                _surface_firebase_warning()
-                                st.rerun()
-                            else:
-                                st.error("Failed to delete template")
-                                _surface_firebase_warning()
-
-                    with action_cols[3]:
-                        new_visibility = "🔒 Make Private" if is_public else "🌐 Make Public"
-                        if st.button(new_visibility, key=f"toggle_visibility_{template_id}"):
-                            success, message = firebase_client.update_template(
-                                template_id=template_id,
-                                user_id=user_id,
-                                is_public=not is_public
-                            )
-                            if success:
-                                st.success(message)
-                                _surface_firebase_warning()
-                                st.rerun()
-                            else:
-                                st.error(message)
-                                _surface_firebase_warning()
-
-                    with st.expander("✏️ Edit Template", expanded=False):
-                        sections_text = "\n".join(sections)
-                        with st.form(f"edit_template_form_{template_id}"):
-                            new_name = st.text_input("Template Name", value=template_name)
-                            new_description = st.text_area("Description", value=description or "", height=100)
-                            new_sections_raw = st.text_area(
-                                "Sections (one per line)",
-                                value=sections_text,
-                                height=160
-                            )
-                            new_public_state = st.checkbox(
-                                "Share publicly",
-                                value=is_public,
-                                help="When enabled, this template is available to other Write Wise users."
-                            )
-                            submitted = st.form_submit_button("Save Changes")
-                            if submitted:
-                                new_sections = [line.strip() for line in new_sections_raw.splitlines() if line.strip()]
-                                if not new_name.strip():
-                                    st.error("Template name is required.")
-                                elif not new_sections:
-                                    st.error("Please provide at least one section.")
-                                else:
-                                    success, message = firebase_client.update_template(
-                                        template_id=template_id,
-                                        user_id=user_id,
-                                        template_name=new_name.strip(),
-                                        sections=new_sections,
-                                        description=new_description.strip(),
-                                        is_public=new_public_state,
-                                    )
-                                    if success:
-                                        st.success(message)
-                                        _surface_firebase_warning()
-                                        st.rerun()
-                                    else:
-                                        st.error(message)
-                                        _surface_firebase_warning()
+            _render_template_card(template, user_id)
 
 # ------------------------------
 # Main Generator Page
 # ------------------------------
-def show_generator_page():
-    st.title("Write Wise - AI Content Generator")
-    st.subheader("Generate high-quality content from your prompts!")
-    
-    # User info display
-    col1, col2 = st.columns([3, 1])
-    with col1:
-        if st.session_state.user:
-            if st.session_state.user.get("guest"):
-                st.caption("🌐 Guest Mode (not saved)")
-            else:
-                st.caption(f"👤 Logged in as: {st.session_state.user.get('email', 'User')}")
-    with col2:
-        if st.button("🚪 Logout" if st.session_state.user and not st.session_state.user.get("guest") else "🏠 Exit Guest"):
-            if st.session_state.persistent_session_token:
-                firebase_client.delete_persistent_session(st.session_state.persistent_session_token)
-                warning_msg = firebase_client.pop_last_error()
-                if warning_msg:
-                    st.warning(warning_msg)
-            st.session_state.persistent_session_token = None
-            _remove_query_param("session")
-            st.session_state.structure_selection_message = None
-            st.session_state.user = None
-            st.session_state.session_id = str(uuid.uuid4())
-            st.rerun()
-    
-    # Privacy toggle for logged-in users
-    if st.session_state.user and not st.session_state.user.get("guest"):
-        st.session_state.do_not_store = st.checkbox(
-            "🔒 Private Session (do not save this session)",
-            value=st.session_state.do_not_store,
-            help="Enable to keep this session ephemeral - it won't be saved to your history"
-        )
-    
-    # Template selection
-    if st.session_state.selected_template:
-        st.success(f"✅ Using structure: {st.session_state.selected_template}")
-        if st.button("❌ Clear Structure"):
-            st.session_state.selected_template = None
-            st.session_state.custom_sections = None
-            st.session_state.main_topic = None
-            st.session_state.additional_context = None
-            st.session_state.structure_selection_message = None
-            st.session_state.pop("structured_prompt_input", None)
-            st.rerun()
-    
+@st.fragment
+def _generator_form(user_id: Optional[str]) -> None:
+    """Prompt inputs, generation options and results; typing here reruns only this fragment."""
     # Structure-based input
-    if st.session_state.selected_template and hasattr(st.session_state, 'custom_sections') and st.session_state.custom_sections:
+    if st.session_state.selected_template and st.session_state.get('custom_sections'):
         st.markdown("---")
         st.markdown("### 📋 Document Structure")
         
         # Show main topic
-        if hasattr(st.session_state, 'main_topic') and st.session_state.main_topic:
+        if st.session_state.get('main_topic'):
             st.markdown(f"**Topic:** {st.session_state.main_topic}")
             main_topic = st.session_state.main_topic
         else:
@@ -830,7 +1058,7 @@ def show_generator_page():
             st.markdown(f"{i}. {section}")
         
         # Additional context
-        if hasattr(st.session_state, 'additional_context') and st.session_state.additional_context:
+        if st.session_state.get('additional_context'):
             st.markdown(f"**Additional Context:** {st.session_state.additional_context}")
             additional_context = st.session_state.additional_context
         else:
@@ -848,19 +1076,13 @@ def show_generator_page():
             placeholder="Describe the angle, audience, or specifics you want reflected in the content..."
         )
         
-        # Build structured prompt
-        user_prompt = f"Topic: {main_topic}\n\n"
-        if custom_prompt_input:
-            user_prompt += f"Prompt: {custom_prompt_input}\n\n"
-        if additional_context:
-            user_prompt += f"Context: {additional_context}\n\n"
-        user_prompt += "Please generate comprehensive content for the following document structure:\n\n"
-        for i, section in enumerate(sections, 1):
-            user_prompt += f"{i}. {section}\n"
+        # The structured prompt is only assembled for the preview or when generating
+        prompt_inputs = (main_topic, custom_prompt_input, additional_context, sections)
+        user_prompt = None
         
         st.markdown("---")
-        with st.expander("👁️ View Generated Prompt"):
-            st.code(user_prompt)
+        if st.checkbox("👁️ View Generated Prompt", key="preview_structured_prompt"):
+            st.code(_structured_prompt(*prompt_inputs))
         
         base_system_instruction = f"""You are a professional content generator. Generate a comprehensive, well-structured document based on the provided structure.
 
@@ -889,66 +1111,76 @@ Format your response with clear section headers (use ## for section titles) so e
         st.session_state.generation_mode = None
     
     # Model selection
-    if "model_choice" not in st.session_state:
-        st.session_state.model_choice = "gemini-2.5-flash"
+    st.session_state.setdefault("model_choice", MODEL_OPTIONS[0])
 
     col1, col2 = st.columns(2)
     with col1:
         model_choice = st.selectbox(
             "Choose AI model:",
-            ["gemini-2.5-flash", "gemini-2.5-pro"],
-            index=["gemini-2.5-flash", "gemini-2.5-pro"].index(st.session_state.model_choice) if st.session_state.model_choice in ["gemini-2.5-flash", "gemini-2.5-pro"] else 0,
+            MODEL_OPTIONS,
+            index=MODEL_OPTIONS.index(st.session_state.model_choice) if st.session_state.model_choice in MODEL_OPTIONS else 0,
             key="model_choice",
         )
     
     with col2:
         depth_choice = st.selectbox(
             "Content Depth:",
-            [
-                "Shallow (high-level overview)",
-                "Medium (moderate detail with examples)",
-                "Deep (very detailed, nuanced, in-depth analysis)"
-            ],
+            DEPTH_CHOICES,
             index=1
         )
     
     # Tone selection
     tone_choice = st.selectbox(
         "🎭 Choose Tone/Theme:",
-        list(TONE_PRESETS.keys()),
+        TONE_CHOICES,
         help="Select the tone and style for your content"
     )
     
     # Format selection
     format_choice = st.selectbox(
         "📐 Output Format:",
-        list(FORMAT_OPTIONS.keys()),
+        FORMAT_CHOICES,
         index=3,  # Default to "Mixed"
         help="Choose how you want the content structured"
     )
     
-    # Map depth to instructions
-    depth_instruction_map = {
-        "Shallow (high-level overview)": "Provide a clear and simple overview. Focus on key points, avoid unnecessary details.",
-        "Medium (moderate detail with examples)": "Provide a moderately detailed explanation with examples and supporting points.",
-        "Deep (very detailed, nuanced, in-depth analysis)": "Provide an in-depth, thorough, and nuanced explanation. Include examples, multiple perspectives, reasoning, and insights."
-    }
-    
-    depth_instruction = depth_instruction_map[depth_choice]
-    tone_instruction = TONE_PRESETS[tone_choice]
-    format_instruction = FORMAT_OPTIONS[format_choice]
-    
     # Generate button
     if st.session_state.generation_mode == "Generate Sections One by One":
         st.markdown("---")
         st.markdown("### Generate Sections")
         
-        # Initialize section results storage
-        if "section_results" not in st.session_state:
-            st.session_state.section_results = {}
-        
-        # Generate individual sections
         sections = st.session_state.custom_sections
+        main_topic = st.session_state.get('main_topic', '')
+        additional_context = st.session_state.get('additional_context', '') or st.session_state.get('context_input', '')
+        custom_prompt_input = st.session_state.get('structured_prompt_input', '')
+        section_system_prompt = _assemble_system_prompt(
+            base_system_instruction, depth_choice, tone_choice, format_choice, SECTION_TASK
+        )
+
+        # Fan every section out to Gemini at once; the calls are network-bound
+        if st.button("⚡ Generate All Sections in Parallel", key="gen_all_sections"):
+            model = _get_model(model_choice, section_system_prompt)
+            progress = st.progress(0.0, text="Generating sections...")
+            for start in range(0, len(sections), SECTION_BATCH_SIZE):
+                batch = sections[start:start + SECTION_BATCH_SIZE]
+                section_prompts = [
+                    _section_prompt(main_topic, section, additional_context, custom_prompt_input)
+                    for section in batch
+                ]
+                outputs = asyncio.run_coroutine_threadsafe(
+                    _generate_sections_async(model, section_prompts), _async_loop()
+                ).result()
+                for section, output_text in zip(batch, outputs):
+                    if isinstance(output_text, Exception):
+                        st.error(f"Error generating {section}: {output_text}")
+                    elif output_text.strip():
+                        st.session_state.section_results[section] = output_text
+                    else:
+                        st.error(f"Failed to generate {section}")
+                completed = start + len(batch)
+                progress.progress(completed / len(sections), text=f"Generated {completed}/{len(sections)} sections")
+
+        # Generate individual sections
         for i, section in enumerate(sections, 1):
             col1, col2, col3 = st.columns([2, 1, 1])
             with col1:
@@ -960,42 +1192,11 @@ Format your response with clear section headers (use ## for section titles) so e
                     st.success("✅ Done")
             
             if generate_section:
-                main_topic = st.session_state.get('main_topic', '')
-                additional_context = st.session_state.get('additional_context', '')
-                custom_prompt_input = st.session_state.get('structured_prompt_input', '')
-                
-                if not additional_context:
-                    additional_context = st.session_state.get('context_input', '')
-
-                if custom_prompt_input:
-                    user_requirements = f"User Requirements/Prompt: {custom_prompt_input}\n\n"
-                else:
-                    user_requirements = ""
-
-                section_prompt = (
-                    f"Topic: {main_topic}\n\n"
-                    f"{user_requirements}"
-                    f"Section to generate: {section}\n\n"
-                    f"Context: {additional_context}\n\n"
-                    "Please generate detailed, comprehensive content specifically for this section. "
-                    "Ensure the response reflects the user's requirements and stays tightly aligned with the section focus."
-                )
+                section_prompt = _section_prompt(main_topic, section, additional_context, custom_prompt_input)
                 
                 with st.spinner(f"Generating {section}..."):
                     try:
-                        system_prompt = f"""
-{base_system_instruction}
-
-CONTENT DEPTH: {depth_instruction}
-TONE & STYLE: {tone_instruction}
-OUTPUT FORMAT: {format_instruction}
-
-Generate high-quality content for this specific section. Focus on relevance, clarity, and completeness.
-"""
-                        model = genai.GenerativeModel(
-                            model_name=model_choice,
-                            system_instruction=system_prompt
-                        )
+                        model = _get_model(model_choice, section_system_prompt)
                         
                         response = model.generate_content(
                             section_prompt,
@@ -1003,24 +1204,15 @@ Generate high-quality content for this specific section. Focus on relevance, cla
                                 "max_output_tokens": 8000,
                                 "temperature": 0.35
                             },
+                            stream=True,
                         )
                         
-                        # Extract text
-                        output_text = ""
-                        if hasattr(response, "candidates") and response.candidates:
-                            for candidate in response.candidates:
-                                content = getattr(candidate, "content", None)
-                                if content and getattr(content, "parts", None):
-                                    for part in content.parts:
-                                        output_text += getattr(part, "text", "")
-                        
-                        if not output_text and getattr(response, "text", None):
-                            output_text = response.text
+                        # Render the section while it streams in
+                        output_text = _stream_markdown(response, st.empty())
                         
                         if output_text.strip():
                             st.session_state.section_results[section] = output_text
                             st.success(f"✅ {section} generated!")
-                            st.markdown(output_text)
                         else:
                             st.error(f"Failed to generate {section}")
                     
@@ -1036,39 +1228,31 @@ Generate high-quality content for this specific section. Focus on relevance, cla
         st.markdown("---")
         if len(st.session_state.section_results) > 0:
             if st.button("📄 Compile All Sections into Final Document", type="primary"):
-                final_document = f"# {st.session_state.get('main_topic', 'Document')}\n\n"
-                
+                document_parts = [f"# {st.session_state.get('main_topic', 'Document')}\n\n"]
                 for i, section in enumerate(sections, 1):
-                    if section in st.session_state.section_results:
-                        final_document += f"## {i}. {section}\n\n"
-                        final_document += st.session_state.section_results[section] + "\n\n"
-                    else:
-                        final_document += f"## {i}. {section}\n\n[Content not generated yet]\n\n"
+                    document_parts.append(f"## {i}. {section}\n\n")
+                    document_parts.append(st.session_state.section_results.get(section, "[Content not generated yet]") + "\n\n")
+                final_document = "".join(document_parts)
+                st.session_state.last_output_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 
                 st.markdown("---")
                 st.markdown("### 📄 Complete Document")
                 st.markdown(final_document)
 
                 # Save compiled document
-                user_id = st.session_state.user.get("uid") or st.session_state.user.get("$id") if st.session_state.user and not st.session_state.user.get("guest") else None
-                if not st.session_state.do_not_store and user_id:
-                    try:
-                        firebase_client.save_message(
-                            st.session_state.session_id,
-                            "assistant",
-                            final_document,
-                            metadata={"title": f"{st.session_state.get('main_topic', 'Document')} - Compiled"},
-                            user_id=user_id,
-                            do_not_store=st.session_state.do_not_store
-                        )
-                    except Exception:
-                        pass
+                if user_id:
+                    _queue_message(
+                        "assistant",
+                        final_document,
+                        metadata={"title": f"{st.session_state.get('main_topic', 'Document')} - Compiled"},
+                    )
+                    _flush_messages(user_id)
                 
                 # Download option
                 st.download_button(
                     "📥 Download Complete Document",
-                    final_document,
-                    file_name=f"{st.session_state.get('main_topic', 'document').replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
+                    final_document.encode("utf-8"),
+                    file_name=f"{st.session_state.get('main_topic', 'document').replace(' ', '_')}_{st.session_state.last_output_timestamp}.md",
                     mime="text/markdown",
                 )
                 
@@ -1077,11 +1261,21 @@ Generate high-quality content for this specific section. Focus on relevance, cla
                     st.session_state.section_results = {}
                     st.rerun()
         
-        generate_btn = False
+        generate_btn = regenerate_btn = False
     else:
-        generate_btn = st.button("✨ Generate Content", type="primary", use_container_width=True)
+        generate_col, regenerate_col = st.columns([4, 1])
+        with generate_col:
+            generate_btn = st.button("✨ Generate Content", type="primary", use_container_width=True)
+        with regenerate_col:
+            regenerate_btn = st.button(
+                "🔄 Regenerate",
+                use_container_width=True,
+                help="Ask the model for a new draft instead of reusing the last result for these inputs",
+            )
     
-    if generate_btn:
+    if generate_btn or regenerate_btn:
+        if user_prompt is None:
+            user_prompt = _structured_prompt(*prompt_inputs)
         if not user_prompt.strip():
             st.warning("Please enter a prompt to generate content.")
         else:
@@ -1089,93 +1283,58 @@ Generate high-quality content for this specific section. Focus on relevance, cla
                 start_time = datetime.now()
                 
                 try:
-                    # Save user message
-                    user_id = st.session_state.user.get("uid") or st.session_state.user.get("$id") if st.session_state.user and not st.session_state.user.get("guest") else None
-                    
-                    if not st.session_state.do_not_store:
-                        try:
-                            firebase_client.save_message(
-                                st.session_state.session_id,
-                                "user",
-                                user_prompt,
-                                metadata={"title": user_prompt[:50] + "..."},
-                                user_id=user_id,
-                                do_not_store=st.session_state.do_not_store
-                            )
-                        except Exception:
-                            pass
+                    # Queue user message; it is written together with the response
+                    _queue_message("user", user_prompt, metadata={"title": user_prompt[:50] + "..."})
                     
                     # Build comprehensive system prompt
-                    system_prompt = f"""
-{base_system_instruction}
-
-CONTENT DEPTH: {depth_instruction}
-TONE & STYLE: {tone_instruction}
-OUTPUT FORMAT: {format_instruction}
-
-Your task is to generate high-quality content based on the user's prompt.
-Use proper grammar and structure, adapt tone appropriately, include headings or examples if needed, and avoid filler or repetition.
-"""
-                    
-                    model = genai.GenerativeModel(
-                        model_name=model_choice,
-                        system_instruction=system_prompt
+                    system_prompt = _assemble_system_prompt(
+                        base_system_instruction, depth_choice, tone_choice, format_choice, DOCUMENT_TASK
                     )
                     
-                    # Generate content
-                    response = model.generate_content(
-                        user_prompt,
-                        generation_config={
-                            "max_output_tokens": 20000,
-                            "temperature": 0.35
-                        },
-                    )
-                    
-                    # Extract text
-                    output_text = ""
-                    if hasattr(response, "candidates") and response.candidates:
-                        for candidate in response.candidates:
-                            content = getattr(candidate, "content", None)
-                            if content and getattr(content, "parts", None):
-                                for part in content.parts:
-                                    output_text += getattr(part, "text", "")
-                    
-                    if not output_text and getattr(response, "text", None):
-                        output_text = response.text
+                    # Identical requests reuse the last output instead of calling Gemini again;
+                    # Regenerate skips the stored output and replaces it with the new draft
+                    cache_key = _generation_key(model_choice, system_prompt, user_prompt)
+                    output_text = None if regenerate_btn else st.session_state.generation_cache.get(cache_key)
+                    st.markdown("---")
+                    if output_text is not None:
+                        st.markdown(output_text)
+                    else:
+                        model = _get_model(model_choice, system_prompt)
+                        
+                        # Generate content, rendering it as it streams in
+                        response = model.generate_content(
+                            user_prompt,
+                            generation_config={
+                                "max_output_tokens": 20000,
+                                "temperature": 0.35
+                            },
+                            stream=True,
+                        )
+                        output_text = _stream_markdown(response, st.empty())
+                        if output_text.strip():
+                            _remember_generation(cache_key, output_text)
                     
                     # Display results
                     if output_text.strip():
                         # Save assistant response
-                        if not st.session_state.do_not_store:
-                            try:
-                                firebase_client.save_message(
-                                    st.session_state.session_id,
-                                    "assistant",
-                                    output_text,
-                                    metadata={"title": user_prompt[:50] + "..."},
-                                    user_id=user_id,
-                                    do_not_store=st.session_state.do_not_store
-                                )
-                            except Exception:
-                                pass
+                        _queue_message("assistant", output_text, metadata={"title": user_prompt[:50] + "..."})
                         
                         st.success("✅ Content Generated Successfully!")
                         
                         # Calculate generation time
-                        elapsed_time = (datetime.now() - start_time).total_seconds()
+                        finished_at = datetime.now()
+                        st.session_state.last_output_timestamp = finished_at.strftime('%Y%m%d_%H%M%S')
+                        elapsed_time = (finished_at - start_time).total_seconds()
                         st.caption(f"⏱️ Generated in {elapsed_time:.2f} seconds")
                         
-                        st.markdown("---")
-                        st.markdown(output_text)
-                        
                         # Download options
                         st.markdown("---")
                         download_col, info_col = st.columns([2, 3])
                         with download_col:
                             st.download_button(
                                 "📥 Download as Text",
-                                output_text,
-                                file_name=f"writewise_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                                output_text.encode("utf-8"),
+                                file_name=f"writewise_{st.session_state.last_output_timestamp}.txt",
                                 mime="text/plain",
                             )
                         with info_col:
@@ -1185,13 +1344,74 @@ Use proper grammar and structure, adapt tone appropriately, include headings or
                 
                 except Exception as e:
                     st.error(f"❌ Error generating content: {e}")
+                finally:
+                    _flush_messages(user_id)
+
+
+def show_generator_page():
+    st.title("Write Wise - AI Content Generator")
+    st.subheader("Generate high-quality content from your prompts!")
+
+    user, is_guest, user_id = _user_snapshot()
+    
+    # User info display
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        if user:
+            if is_guest:
+                st.caption("🌐 Guest Mode (not saved)")
+            else:
+                st.caption(f"👤 Logged in as: {user.get('email', 'User')}")
+    with col2:
+        if st.button("🚪 Logout" if user and not is_guest else "🏠 Exit Guest"):
+            # Remaining queued messages and the session token go out in one write
+            pending = st.session_state.pending_writes
+            if st.session_state.persistent_session_token or pending:
+                firebase_client.flush_session_end(
+                    st.session_state.persistent_session_token,
+                    st.session_state.session_id,
+                    pending,
+                    user_id=user_id,
+                )
+                st.session_state.pending_writes = []
+                if pending:
+                    _invalidate_history_cache()
+            st.session_state.persistent_session_token = None
+            _remove_query_param("session")
+            st.session_state.structure_selection_message = None
+            st.session_state.user = None
+            st.session_state.session_id = str(uuid.uuid4())
+            st.rerun()
+    
+    # Privacy toggle for logged-in users
+    if user and not is_guest:
+        st.session_state.do_not_store = st.checkbox(
+            "🔒 Private Session (do not save this session)",
+            value=st.session_state.do_not_store,
+            help="Enable to keep this session ephemeral - it won't be saved to your history"
+        )
+    
+    # Template selection
+    if st.session_state.selected_template:
+        st.success(f"✅ Using structure: {st.session_state.selected_template}")
+        if st.button("❌ Clear Structure"):
+            st.session_state.selected_template = None
+            st.session_state.custom_sections = None
+            st.session_state.main_topic = None
+            st.session_state.additional_context = None
+            st.session_state.structure_selection_message = None
+            st.session_state.pop("structured_prompt_input", None)
+            st.rerun()
+    
+    _generator_form(user_id)
 
 # ------------------------------
 # Navigation & Main App
 # ------------------------------
 # Check if user is authenticated
 if not st.session_state.user:
-    show_auth_page()
+    with _fb_errors():
+        show_auth_page()
 else:
     # Sidebar navigation
     with st.sidebar:
@@ -1216,12 +1436,13 @@ else:
         st.caption("Powered by Google Gemini")
     
     # Show appropriate page
-    if st.session_state.current_page == "generator":
-        show_generator_page()
-    elif st.session_state.current_page == "history":
-        show_history_page()
-    elif st.session_state.current_page == "templates":
-        show_template_page()
+    with _fb_errors():
+        if st.session_state.current_page == "generator":
+            show_generator_page()
+        elif st.session_state.current_page == "history":
+            show_history_page()
+        elif st.session_state.current_page == "templates":
+            show_template_page()
 
 # Footer
 st.markdown("---")
@@ -1,13 +1,27 @@
+import atexit
+import contextvars
+import functools
 import os
 import time
 import uuid
+import heapq
+import inspect
+import io
 import json
+import queue
+import re
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
-from typing import List, Dict, Any, Optional, Tuple, Callable
+from typing import IO, Iterator, List, Dict, Any, Optional, Tuple, Callable
 
 try:
     import requests
     from requests import exceptions as requests_exceptions
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
 except ImportError:
     requests = None
     requests_exceptions = None
@@ -17,6 +31,136 @@ try:
 except ImportError:
     firebase_lib = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps_indented(data: Any) -> str:
+    """Pretty-print JSON for export, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(data, indent=2)
+
+
+# Errors recorded for the current context, so concurrent Streamlit sessions keep separate logs
+_error_log_var: "contextvars.ContextVar[Optional[List[str]]]" = contextvars.ContextVar(
+    "firebase_error_log", default=None
+)
+
+
+def _error_log() -> List[str]:
+    """Return the current context's error log, creating it on first use."""
+    errors = _error_log_var.get()
+    if errors is None:
+        errors = []
+        _error_log_var.set(errors)
+    return errors
+
+
+def _with_error_log(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Bind fn to the caller's context so errors it records on another thread reach the caller."""
+    _error_log()
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def _requires_user(not_configured: Any, anonymous: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Return early unless Firebase is configured and the call names a signed-in user.
+
+    ``not_configured`` and ``anonymous`` are the values returned for each failed check;
+    lists are copied so callers never share one.
+    """
+    def decorator(method: Callable[..., Any]) -> Callable[..., Any]:
+        # Position of user_id among the arguments after self, resolved once
+        user_index = list(inspect.signature(method).parameters).index("user_id") - 1
+
+        @functools.wraps(method)
+        def wrapper(self: "FirebaseClient", *args: Any, **kwargs: Any) -> Any:
+            if not self.is_configured():
+                return list(not_configured) if isinstance(not_configured, list) else not_configured
+            user_id = args[user_index] if len(args) > user_index else kwargs.get("user_id")
+            if not user_id or user_id == "anonymous":
+                return list(anonymous) if isinstance(anonymous, list) else anonymous
+            return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _sortable_id(now_ms: int) -> str:
+    """Return a random ID whose lexicographic order follows creation time."""
+    return f"{now_ms:013x}{secrets.token_hex(6)}"
+
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _json_body(payload: Any) -> bytes:
+    """Encode a REST request body, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode("utf-8")
+
+
+def _json_response(response: Any) -> Any:
+    """Decode a REST response body, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+# Values copied from the sample config rather than a real project
+_PLACEHOLDER_RE = re.compile("|".join(map(re.escape, ["your-project", "your_firebase", "your-firebase", "<"])))
+
+# Refreshed ID tokens are reused until this close to expiry
+TOKEN_REFRESH_MARGIN = 60
+TOKEN_CACHE_SIZE = 1024
+# Child references cached per database reference before the cache is reset
+CHILD_CACHE_SIZE = 256
+
+# Sessions remembered as existing, so saves can skip the existence probe
+KNOWN_SESSIONS_SIZE = 4096
+
+# Template reads served from memory: entry cap and lifetimes in seconds
+TEMPLATE_CACHE_SIZE = 1024
+TEMPLATE_TTL = 300
+TEMPLATE_LIST_TTL = 60
+
+# Deferred non-critical writes held before the oldest is dropped
+WRITE_QUEUE_SIZE = 1000
+# Longest a read waits, in seconds, for the same user's deferred writes to land
+WRITE_WAIT_TIMEOUT = 10.0
+
+# Concurrent per-session reads when fetching several sessions' messages
+EXPORT_FETCH_WORKERS = 8
+
+# Set in a session's messages_by_session index once it lists every message of the session,
+# including those saved before the index existed
+INDEX_COMPLETE_KEY = "_complete"
+
+
+def _build_http_session() -> Optional[Any]:
+    """Create a pooled requests.Session that retries transient errors on idempotent reads.
+
+    POSTs are never retried: signUp and the one-time OAuth code exchange must not repeat.
+    """
+    if not requests:
+        return None
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.2,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    return session
+
 
 class FirebaseSnapshot:
     """Lightweight snapshot wrapper matching Pyrebase's interface."""
@@ -27,12 +171,19 @@ class FirebaseSnapshot:
     def val(self) -> Any:
         return self._data
 
-    def each(self) -> List["FirebaseChildSnapshot"]:
+    def each(self) -> Iterator["FirebaseChildSnapshot"]:
         if isinstance(self._data, dict):
-            return [FirebaseChildSnapshot(key, value) for key, value in self._data.items()]
-        if isinstance(self._data, list):
-            return [FirebaseChildSnapshot(str(index), value) for index, value in enumerate(self._data)]
-        return []
+            for key, value in self._data.items():
+                yield FirebaseChildSnapshot(key, value)
+        elif isinstance(self._data, list):
+            for index, value in enumerate(self._data):
+                yield FirebaseChildSnapshot(str(index), value)
+
+    __iter__ = each
+
+    def empty(self) -> bool:
+        """True when there are no children to iterate."""
+        return not isinstance(self._data, (dict, list)) or not self._data
 
 
 class FirebaseChildSnapshot(FirebaseSnapshot):
@@ -47,18 +198,31 @@ class FirebaseChildSnapshot(FirebaseSnapshot):
 class FirebaseApplicationAdapter:
     """Adapter to provide Pyrebase-like interface for firebase.FirebaseApplication."""
 
-    def __init__(self, app: Any, path: Optional[List[str]] = None, error_callback: Optional[Callable[[str], None]] = None):
+    def __init__(self, app: Any, path: Optional[List[str]] = None, error_callback: Optional[Callable[[str], None]] = None,
+                 connection: Optional[Any] = None):
         self._app = app
         self._path = path or []
         self._error_callback = error_callback
+        # Shared requests.Session so every call reuses pooled keep-alive connections
+        self._connection = connection
+        # Adapters are immutable, so child references can be reused across calls
+        self._children: Dict[str, "FirebaseApplicationAdapter"] = {}
+        self._path_str = "/" + "/".join(self._path) if self._path else "/"
 
     def child(self, name: str) -> "FirebaseApplicationAdapter":
-        return FirebaseApplicationAdapter(self._app, self._path + [name], self._error_callback)
+        child = self._children.get(name)
+        if child is None:
+            if len(self._children) >= CHILD_CACHE_SIZE:
+                # Keys such as message IDs are mostly used once; start over rather than grow without bound
+                self._children.clear()
+            child = FirebaseApplicationAdapter(self._app, self._path + [name], self._error_callback, self._connection)
+            self._children[name] = child
+        return child
 
     def set(self, data: Any) -> None:
         parent_path, key = self._parent_path_and_key()
         try:
-            self._app.put(parent_path, key, data)
+            self._app.put(parent_path, key, data, connection=self._connection)
         except Exception as exc:
             if self._handle_http_error(exc, action="set", path=self._full_path()):
                 return
@@ -69,8 +233,12 @@ class FirebaseApplicationAdapter:
 
     def update(self, data: Dict[str, Any]) -> None:
         try:
-            self._app.patch(self._full_path(), data)
+            self._app.patch(self._full_path(), data, connection=self._connection)
         except Exception as exc:
+            if not self._path:
+                # A multi-path update at the root has no parent to fall back to, and skipping
+                # it would report deletes that never happened; the caller handles the failure
+                raise
             if requests_exceptions and isinstance(exc, requests_exceptions.HTTPError):
                 response = getattr(exc, "response", None)
                 if response is None or response.status_code == 404:
@@ -82,7 +250,7 @@ class FirebaseApplicationAdapter:
                     else:
                         merged = data
                     try:
-                        self._app.put(parent_path, key, merged)
+                        self._app.put(parent_path, key, merged, connection=self._connection)
                         return
                     except Exception as put_exc:
                         if self._handle_http_error(put_exc, action="put", path=self._full_path()):
@@ -95,24 +263,36 @@ class FirebaseApplicationAdapter:
                 return
             raise
 
-    def get(self) -> FirebaseSnapshot:
+    def get(self, params: Optional[Dict[str, Any]] = None) -> FirebaseSnapshot:
         if not self._path:
-            data = self._safe_get("/", None)
+            data = self._safe_get("/", None, params)
         elif len(self._path) == 1:
-            data = self._safe_get(f"/{self._path[0]}", None)
+            data = self._safe_get(f"/{self._path[0]}", None, params)
         else:
             parent_path, key = self._parent_path_and_key()
-            data = self._safe_get(parent_path, key)
+            data = self._safe_get(parent_path, key, params)
         return FirebaseSnapshot(data)
 
+    def query(self, order_by: str, equal_to: Any) -> Optional[FirebaseSnapshot]:
+        """Read only the children whose ``order_by`` field equals ``equal_to``.
+
+        Returns None when the server rejects the query, e.g. because the database
+        rules do not declare a matching ``.indexOn``, so callers can fall back.
+        """
+        params = {"orderBy": json.dumps(order_by), "equalTo": json.dumps(equal_to)}
+        try:
+            return FirebaseSnapshot(self._app.get(self._full_path(), None, params=params, connection=self._connection))
+        except Exception as exc:
+            if requests_exceptions and isinstance(exc, requests_exceptions.RequestException):
+                return None
+            raise
+
     def remove(self) -> None:
         parent_path, key = self._parent_path_and_key()
-        self._app.delete(parent_path, key)
+        self._app.delete(parent_path, key, connection=self._connection)
 
     def _full_path(self) -> str:
-        if not self._path:
-            return "/"
-        return "/" + "/".join(self._path)
+        return self._path_str
 
     def _parent_path_and_key(self) -> Tuple[str, str]:
         if not self._path:
@@ -122,9 +302,9 @@ class FirebaseApplicationAdapter:
         parent = "/" + "/".join(self._path[:-1])
         return parent, self._path[-1]
 
-    def _safe_get(self, path: str, key: Optional[str]) -> Any:
+    def _safe_get(self, path: str, key: Optional[str], params: Optional[Dict[str, Any]] = None) -> Any:
         try:
-            return self._app.get(path, key)
+            return self._app.get(path, key, params=params, connection=self._connection)
         except Exception as exc:
             if requests_exceptions and isinstance(exc, requests_exceptions.HTTPError):
                 response = getattr(exc, "response", None)
@@ -165,13 +345,45 @@ class FirebaseClient:
         self.google_client_id = os.environ.get("GOOGLE_CLIENT_ID")
         self.google_client_secret = os.environ.get("GOOGLE_CLIENT_SECRET")
 
+        # REST endpoints carrying the API key, built once
+        self._identity_url_tmpl = f"https://identitytoolkit.googleapis.com/v1/accounts:{{}}?key={self.api_key}"
+        self._securetoken_url = f"https://securetoken.googleapis.com/v1/token?key={self.api_key}"
+
         self._db = db
         self._auth = auth
         self._initialized = self._db is not None
-        self._last_error: Optional[str] = None
-
-        if auto_initialize and not self._initialized:
-            self._initialize_firebase()
+        # Keep-alive pool for auth and OAuth requests
+        self._http = _build_http_session()
+        # The database gets a pool of its own: python-firebase sets a JSON Content-Type
+        # and its own timeout on whatever session it is handed, which form-encoded
+        # token and OAuth requests must not inherit
+        self._db_http = _build_http_session()
+        # refresh_token -> (securetoken response, reuse-until epoch), least recently used first
+        self._token_cache: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._token_lock = threading.Lock()
+        # (user_id, session_id) pairs whose session record is known to exist, least recently used first
+        self._known_sessions: "OrderedDict[Tuple[str, str], bool]" = OrderedDict()
+        # (kind, *args) -> (expires_at, value) for template reads, least recently used first
+        self._template_cache: "OrderedDict[Tuple[Any, ...], Tuple[float, Any]]" = OrderedDict()
+        self._template_lock = threading.Lock()
+        # Shared worker threads for reads that can overlap with other requests
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="firebase")
+        # Write-behind queue of (user_id, write) for bookkeeping writes the caller does not wait on
+        self._write_queue: "queue.Queue[Tuple[str, Callable[[], None]]]" = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        # Warnings from initialization and the writer thread, which no script run's context sees;
+        # drained alongside the per-context log
+        self._shared_errors: List[str] = []
+        self._shared_errors_lock = threading.Lock()
+        # user_id -> writes queued or in flight, so reads only wait on their own user's writes
+        self._pending_writes: Dict[str, int] = {}
+        self._pending_cond = threading.Condition()
+
+        # The database connection is set up on first use rather than at import time
+        self._init_pending = auto_initialize and not self._initialized
+        self._init_lock = threading.Lock()
+        self._warmed = False
 
     # ---------------------------------------------------------
     # Initialization
@@ -180,38 +392,129 @@ class FirebaseClient:
     def _initialize_firebase(self):
         """Initialize Firebase using the firebase (python-firebase) package."""
         if not self.api_key or not self.database_url:
-            self._record_error("Firebase configuration is incomplete. Please provide API key and database URL.")
+            self._record_shared_error("Firebase configuration is incomplete. Please provide API key and database URL.")
             return
 
-        placeholder_tokens = {"your-project", "your_firebase", "your-firebase", "<"}
-        target_strings = [self.api_key or "", self.database_url or "", self.project_id or ""]
-        if any(any(token in value for token in placeholder_tokens) for value in target_strings):
-            self._record_error("Firebase initialization skipped: placeholder configuration detected.")
+        if any(_PLACEHOLDER_RE.search(value or "") for value in (self.api_key, self.database_url, self.project_id)):
+            self._record_shared_error("Firebase initialization skipped: placeholder configuration detected.")
             self._initialized = False
             return
 
         if not firebase_lib:
-            self._record_error("Firebase initialization failed: 'firebase' package not installed.")
+            self._record_shared_error("Firebase initialization failed: 'firebase' package not installed.")
             self._initialized = False
             return
 
         try:
             firebase_app = firebase_lib.FirebaseApplication(self.database_url, None)
-            self._db = FirebaseApplicationAdapter(firebase_app, error_callback=self._record_error)
+            self._db = FirebaseApplicationAdapter(
+                firebase_app,
+                error_callback=self._record_error,
+                connection=self._db_http,
+            )
             self._initialized = True
-            self._record_error(None)
         except Exception as e:
-            self._record_error(f"Firebase initialization failed: {e}")
+            self._record_shared_error(f"Firebase initialization failed: {e}")
             self._initialized = False
 
     def is_configured(self) -> bool:
+        if self._init_pending:
+            with self._init_lock:
+                if self._init_pending:
+                    self._initialize_firebase()
+                    self._init_pending = False
         return self._initialized and self._db is not None
 
+    def warmup(self) -> None:
+        """Issue a cheap keys-only read so the first user action skips connection setup."""
+        # The pooled connection stays open afterwards, so later reruns need no warmup
+        if self._warmed or not self.is_configured():
+            return
+        try:
+            self._db.get(params={"shallow": "true"})
+            self._warmed = True
+        except Exception:
+            pass
+
+    def _write_behind(self, user_id: str, write: Callable[[], None]) -> None:
+        """Queue a non-critical bookkeeping write for the background writer thread.
+
+        When the queue is full the oldest write is dropped, so only writes that can be
+        lost without losing user data belong here.
+        """
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run_writer, name="firebase-writer", daemon=True)
+                self._writer.start()
+        with self._pending_cond:
+            self._pending_writes[user_id] = self._pending_writes.get(user_id, 0) + 1
+        while True:
+            try:
+                self._write_queue.put_nowait((user_id, write))
+                return
+            except queue.Full:
+                try:
+                    dropped_user_id, _ = self._write_queue.get_nowait()
+                    self._write_done(dropped_user_id)
+                    self._record_error("Firebase write queue full; dropped the oldest pending update.")
+                except queue.Empty:
+                    pass
+
+    def _write_done(self, user_id: str) -> None:
+        with self._pending_cond:
+            remaining = self._pending_writes.get(user_id, 0) - 1
+            if remaining > 0:
+                self._pending_writes[user_id] = remaining
+            else:
+                self._pending_writes.pop(user_id, None)
+            self._pending_cond.notify_all()
+
+    def _has_pending_writes(self, user_id: str) -> bool:
+        with self._pending_cond:
+            return user_id in self._pending_writes
+
+    def _apply_deferred(self, write: Callable[[], None]) -> None:
+        try:
+            write()
+        except Exception as exc:
+            self._record_error(f"Deferred Firebase write failed: {exc}")
+
+    def _run_writer(self) -> None:
+        # The script run that queued a write has usually finished by the time it fails,
+        # so whatever a write records moves to the shared log
+        errors = _error_log()
+        while True:
+            user_id, write = self._write_queue.get()
+            try:
+                self._apply_deferred(write)
+            finally:
+                self._write_done(user_id)
+                if errors:
+                    with self._shared_errors_lock:
+                        self._shared_errors.extend(errors)
+                    errors.clear()
+
+    def wait_for_writes(self, user_id: Optional[str] = None, timeout: float = WRITE_WAIT_TIMEOUT) -> bool:
+        """Wait until queued write-behind updates have been applied, or ``timeout`` seconds pass.
+
+        With ``user_id`` only that user's writes are waited on. Returns False on timeout.
+        """
+        with self._pending_cond:
+            if user_id is None:
+                done = self._pending_cond.wait_for(lambda: not self._pending_writes, timeout)
+            else:
+                done = self._pending_cond.wait_for(lambda: user_id not in self._pending_writes, timeout)
+        if not done:
+            self._record_error("Timed out waiting for queued Firebase writes; recent changes may not show yet.")
+        return done
+
     def set_backend(self, db: Any, auth: Optional[Any] = None) -> None:
         """Override the Firebase backend (useful for tests)."""
         self._db = db
         self._auth = auth
         self._initialized = db is not None
+        self._init_pending = False
+        self._warmed = False
 
     def supports_google_auth(self) -> bool:
         if not self.api_key or not requests:
@@ -228,9 +531,10 @@ class FirebaseClient:
         if not self.api_key or not requests:
             return None
         try:
-            url = f"https://identitytoolkit.googleapis.com/v1/accounts:{endpoint}?key={self.api_key}"
-            response = requests.post(url, json=payload, timeout=10)
-            return response.json() if response.status_code == 200 else {"error": response.json()}
+            url = self._identity_url_tmpl.format(endpoint)
+            response = self._http.post(url, data=_json_body(payload), headers=_JSON_HEADERS, timeout=10)
+            data = _json_response(response)
+            return data if response.status_code == 200 else {"error": data}
         except requests_exceptions.Timeout:
             return {"error": "Request timed out while contacting Firebase."}
         except Exception as e:
@@ -242,29 +546,52 @@ class FirebaseClient:
         if not refresh_token:
             return None, "Missing refresh token."
 
+        with self._token_lock:
+            cached = self._token_cache.get(refresh_token)
+            if cached and cached[1] > time.time():
+                self._token_cache.move_to_end(refresh_token)
+                return cached[0], "Token refreshed (cached)."
+
         try:
-            response = requests.post(
-                f"https://securetoken.googleapis.com/v1/token?key={self.api_key}",
+            response = self._http.post(
+                self._securetoken_url,
                 data={
                     "grant_type": "refresh_token",
                     "refresh_token": refresh_token,
                 },
                 timeout=10,
             )
-            data = response.json()
+            data = _json_response(response)
             if response.status_code != 200:
                 error_detail = data.get("error", {}) if isinstance(data, dict) else {}
                 if isinstance(error_detail, dict):
                     message = error_detail.get("message") or json.dumps(error_detail)
                 else:
                     message = str(error_detail) if error_detail else "Failed to refresh session."
+                with self._token_lock:
+                    self._token_cache.pop(refresh_token, None)
                 return None, message
+            self._cache_refreshed_token(refresh_token, data)
             return data, "Token refreshed."
         except requests_exceptions.Timeout:
             return None, "Request timed out while refreshing session."
         except Exception as exc:
             return None, str(exc)
 
+    def _cache_refreshed_token(self, refresh_token: str, data: Dict[str, Any]) -> None:
+        try:
+            expires_in = int(data.get("expires_in", 3600))
+        except (TypeError, ValueError):
+            expires_in = 3600
+        entry = (data, time.time() + expires_in - TOKEN_REFRESH_MARGIN)
+        with self._token_lock:
+            # The rotated refresh token is what the next resume will present
+            for token in {refresh_token, data.get("refresh_token") or refresh_token}:
+                self._token_cache[token] = entry
+                self._token_cache.move_to_end(token)
+            while len(self._token_cache) > TOKEN_CACHE_SIZE:
+                self._token_cache.popitem(last=False)
+
     def create_persistent_session(self, user_id: str, refresh_token: str, metadata: Optional[Dict[str, Any]] = None) -> Tuple[Optional[str], str]:
         if not self.is_configured():
             return None, "Firebase not configured."
@@ -272,18 +599,18 @@ class FirebaseClient:
             return None, "Missing refresh token."
 
         session_token = uuid.uuid4().hex
+        now = int(time.time())
         session_payload: Dict[str, Any] = {
             "user_id": user_id,
             "refresh_token": refresh_token,
-            "created_at": int(time.time()),
-            "updated_at": int(time.time()),
+            "created_at": now,
+            "updated_at": now,
         }
         if metadata:
             session_payload["metadata"] = metadata
 
         try:
             self._db.child("auth_sessions").child(session_token).set(session_payload)
-            self._record_error(None)
             return session_token, "Persistent session created."
         except Exception as exc:
             self._record_error(f"Failed to create persistent session: {exc}")
@@ -304,15 +631,24 @@ class FirebaseClient:
         refresh_token = record.get("refresh_token")
         if not refresh_token:
             return None, "Session missing refresh token."
+        # The user record does not depend on the refreshed token, so fetch both at once
+        record_user_id = record.get("user_id")
+        user_future = (
+            self._executor.submit(_with_error_log(lambda: self._db.child("users").child(record_user_id).get().val()))
+            if record_user_id else None
+        )
         refresh_result, message = self._refresh_id_token(refresh_token)
         if not refresh_result:
             return None, message or "Failed to refresh session."
 
-        user_id = refresh_result.get("user_id") or record.get("user_id")
+        user_id = refresh_result.get("user_id") or record_user_id
         if not user_id:
             return None, "Session missing user information."
 
-        user_data = self._db.child("users").child(user_id).get().val() or {}
+        if user_future is not None and user_id == record_user_id:
+            user_data = user_future.result() or {}
+        else:
+            user_data = self._db.child("users").child(user_id).get().val() or {}
         id_token = refresh_result.get("id_token")
         if not id_token:
             return None, "Failed to refresh authentication token."
@@ -322,22 +658,22 @@ class FirebaseClient:
         if email:
             user_data["email"] = email
 
+        now = int(time.time())
         user_data.update({
             "uid": user_id,
             "id_token": id_token,
             "refresh_token": new_refresh_token,
-            "last_login": int(time.time()),
+            "last_login": now,
         })
 
         try:
-            update_payload = {
-                "refresh_token": new_refresh_token,
-                "updated_at": int(time.time()),
-                "expires_in": refresh_result.get("expires_in"),
-            }
-            self._db.child("auth_sessions").child(session_token).update(update_payload)
-            self._db.child("users").child(user_id).update({"last_login": int(time.time())})
-            self._record_error(None)
+            # Session bookkeeping and the user's last login go out as one multi-path update
+            self._db.update({
+                f"auth_sessions/{session_token}/refresh_token": new_refresh_token,
+                f"auth_sessions/{session_token}/updated_at": now,
+                f"auth_sessions/{session_token}/expires_in": refresh_result.get("expires_in"),
+                f"users/{user_id}/last_login": now,
+            })
         except Exception as exc:
             self._record_error(f"Failed to update session metadata: {exc}")
 
@@ -348,7 +684,6 @@ class FirebaseClient:
             return False
         try:
             self._db.child("auth_sessions").child(session_token).remove()
-            self._record_error(None)
             return True
         except Exception as exc:
             self._record_error(f"Failed to delete session token: {exc}")
@@ -409,10 +744,12 @@ class FirebaseClient:
         if "email" not in user_data:
             user_data["email"] = email.lower()
         
-        user_data.update({"uid": user_id, "id_token": id_token, "last_login": int(time.time())})
+        now = int(time.time())
+        user_data.update({"uid": user_id, "id_token": id_token, "last_login": now})
         if refresh_token:
             user_data["refresh_token"] = refresh_token
-        self._db.child("users").child(user_id).update({"last_login": int(time.time()), "email": user_data["email"]})
+        login_update = {"last_login": now, "email": user_data["email"]}
+        self._write_behind(user_id, lambda: self._db.child("users").child(user_id).update(login_update))
         return user_data, "Authenticated successfully."
 
     def authenticate_with_google(self, token_payload: Any) -> Tuple[Optional[Dict[str, Any]], str]:
@@ -487,8 +824,7 @@ class FirebaseClient:
             }
             if state:
                 params["state"] = state
-            query = "&".join([f"{k}={v}" for k, v in params.items()])
-            return f"https://accounts.google.com/o/oauth2/v2/auth?{query}", None, None
+            return f"https://accounts.google.com/o/oauth2/v2/auth?{urlencode(params)}", None, None
 
         if not requests:
             return "", None, "The 'requests' package is required for Google Sign-In."
@@ -501,15 +837,16 @@ class FirebaseClient:
             if state:
                 payload["state"] = state
 
-            response = requests.post(
-                f"https://identitytoolkit.googleapis.com/v1/accounts:createAuthUri?key={self.api_key}",
-                json=payload,
+            response = self._http.post(
+                self._identity_url_tmpl.format("createAuthUri"),
+                data=_json_body(payload),
+                headers=_JSON_HEADERS,
                 timeout=10,
             )
             if response.status_code != 200:
                 error_message = ""
                 try:
-                    data = response.json()
+                    data = _json_response(response)
                     error_info = data.get("error", {})
                     if isinstance(error_info, dict):
                         error_message = error_info.get("message") or json.dumps(error_info)
@@ -518,7 +855,7 @@ class FirebaseClient:
                 except Exception:
                     error_message = response.text
                 return "", None, error_message or "Failed to initialize Google Sign-In."
-            data = response.json()
+            data = _json_response(response)
             return data.get("authUri", ""), data.get("sessionId"), None
         except Exception as exc:
             self._record_error(f"Failed to create Google auth URI: {exc}")
@@ -530,7 +867,7 @@ class FirebaseClient:
 
         if self.google_client_id and self.google_client_secret:
             try:
-                response = requests.post(
+                response = self._http.post(
                     "https://oauth2.googleapis.com/token",
                     data={
                         "code": code,
@@ -543,7 +880,7 @@ class FirebaseClient:
                 )
                 if response.status_code != 200:
                     return None
-                return response.json()
+                return _json_response(response)
             except Exception as exc:
                 self._record_error(f"Failed to exchange code via Google OAuth: {exc}")
                 return None
@@ -562,15 +899,16 @@ class FirebaseClient:
             if session_id:
                 payload["sessionId"] = session_id
 
-            response = requests.post(
-                f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithIdp?key={self.api_key}",
-                json=payload,
+            response = self._http.post(
+                self._identity_url_tmpl.format("signInWithIdp"),
+                data=_json_body(payload),
+                headers=_JSON_HEADERS,
                 timeout=10,
             )
             if response.status_code != 200:
                 self._record_error(f"signInWithIdp failed: {response.text}")
                 return None
-            return response.json()
+            return _json_response(response)
         except Exception as exc:
             self._record_error(f"Failed to exchange code via Identity Toolkit: {exc}")
             return None
@@ -595,71 +933,233 @@ class FirebaseClient:
             "timestamp": timestamp,
             "user_id": user_id or "anonymous",
         }
-        self._db.child("messages").child(msg_id).set(message)
-        
-        # Update session metadata
-        self._update_session_metadata(session_id, user_id, metadata, timestamp)
+        # Write the message, its per-session index entry and the session metadata together
+        try:
+            self._send_message_updates({
+                f"messages/{msg_id}": message,
+                f"messages_by_session/{session_id}/{msg_id}": timestamp,
+            }, session_id, user_id, metadata, timestamp)
+        except Exception as e:
+            self._record_error(f"Error saving message: {e}")
+            return None
         
         return message
 
+    def save_messages(self, session_id: str,
+                      entries: List[Tuple[str, str, Optional[Dict[str, Any]], int]],
+                      user_id: Optional[str] = None,
+                      do_not_store: bool = False) -> List[Dict[str, Any]]:
+        """Persist several (role, content, metadata, timestamp) entries with one multi-path write."""
+        if not self.is_configured() or do_not_store or not entries:
+            return []
+        updates, messages = self._message_updates(session_id, entries, user_id)
+        # Session metadata follows the newest entry and counts the whole batch
+        _, _, metadata, timestamp = entries[-1]
+        try:
+            self._send_message_updates(updates, session_id, user_id, metadata, timestamp, count=len(entries))
+        except Exception as e:
+            self._record_error(f"Error saving messages: {e}")
+            return []
+        return messages
+
+    def flush_session_end(self, session_token: Optional[str], session_id: str,
+                          entries: List[Tuple[str, str, Optional[Dict[str, Any]], int]],
+                          user_id: Optional[str] = None) -> bool:
+        """Write any pending messages and drop the persistent session token in a single PATCH."""
+        if not self.is_configured() or (not session_token and not entries):
+            return False
+        updates, _ = self._message_updates(session_id, entries, user_id)
+        if session_token:
+            # A null value in a multi-path update deletes that location
+            updates[f"auth_sessions/{session_token}"] = None
+        try:
+            if entries:
+                _, _, metadata, timestamp = entries[-1]
+                self._send_message_updates(updates, session_id, user_id, metadata, timestamp, count=len(entries))
+            else:
+                self._db.update(updates)
+        except Exception as exc:
+            self._record_error(f"Failed to close session: {exc}")
+            return False
+        return True
+
+    def _send_message_updates(self, updates: Dict[str, Any], session_id: str, user_id: Optional[str],
+                              metadata: Optional[Dict[str, Any]], timestamp: int, count: int = 1) -> None:
+        """Send message writes, folding the session bookkeeping into the same PATCH when possible."""
+        if not user_id or user_id == "anonymous":
+            # Anonymous messages have no session record to maintain
+            self._db.update(updates)
+            return
+        # Known sessions with none of the user's bookkeeping queued ahead can be updated inline
+        # without reordering writes
+        inline = (user_id, session_id) in self._known_sessions and not self._has_pending_writes(user_id)
+        if inline:
+            session_prefix = f"sessions/{user_id}/{session_id}"
+            updates[f"{session_prefix}/updated_at"] = timestamp
+            updates[f"{session_prefix}/message_count"] = {".sv": {"increment": count}}
+            if metadata and "title" in metadata:
+                updates[f"{session_prefix}/title"] = metadata["title"]
+        self._db.update(updates)
+        if not inline:
+            self._update_session_metadata(session_id, user_id, metadata, timestamp, count)
+
+    def _message_updates(self, session_id: str,
+                         entries: List[Tuple[str, str, Optional[Dict[str, Any]], int]],
+                         user_id: Optional[str]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Build multi-path update entries for a batch of messages."""
+        updates: Dict[str, Any] = {}
+        messages = []
+        # One random ID per batch, suffixed by position, keeps keys unique without a uuid4 per message
+        batch_id = uuid.uuid4()
+        for index, (role, content, metadata, timestamp) in enumerate(entries):
+            message = {
+                "session_id": session_id,
+                "role": role,
+                "content": content,
+                "metadata": metadata or {},
+                "timestamp": timestamp,
+                "user_id": user_id or "anonymous",
+            }
+            msg_id = f"{batch_id}-{index}"
+            updates[f"messages/{msg_id}"] = message
+            updates[f"messages_by_session/{session_id}/{msg_id}"] = timestamp
+            messages.append(message)
+        return updates, messages
+
     def get_messages(self, session_id: str, limit: int = 200, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
         if not self.is_configured():
             return []
         try:
-            all_msgs = self._db.child("messages").get()
-            if not all_msgs.each():
-                return []
+            msgs = [
+                msg for msg in self._session_messages(session_id, limit=limit).values()
+                if user_id is None or msg.get("user_id") == user_id
+            ]
             
-            # Filter messages by session_id and optionally by user_id
-            msgs = []
-            for m in all_msgs.each():
-                msg_val = m.val()
-                if msg_val.get("session_id") == session_id:
-                    if user_id is None or msg_val.get("user_id") == user_id:
-                        msgs.append(msg_val)
-            
-            msgs.sort(key=lambda x: x.get("timestamp", 0))
-            self._record_error(None)
-            return msgs[:limit]
+            by_timestamp = lambda x: x.get("timestamp", 0)
+            if len(msgs) > limit:
+                # Partial selection instead of sorting messages that are cut off anyway
+                msgs = heapq.nsmallest(limit, msgs, key=by_timestamp)
+            else:
+                msgs.sort(key=by_timestamp)
+            return msgs
         except Exception as e:
             self._record_error(f"Error getting messages: {e}")
             return []
 
+    def _session_messages(self, session_id: str, limit: Optional[int] = None,
+                          backfill: bool = True) -> Dict[str, Dict[str, Any]]:
+        """Return a session's messages keyed by message ID.
+
+        A complete index maps message IDs to timestamps, so only the ``limit`` oldest
+        messages are fetched. Otherwise the session may predate the index: its messages
+        are read by session_id and, with ``backfill``, the index is completed so later
+        reads take the indexed path.
+        """
+        index = self._db.child("messages_by_session").child(session_id).get().val()
+        index = index if isinstance(index, dict) else {}
+        if index.pop(INDEX_COMPLETE_KEY, False):
+            # Entries written before the index held only timestamps carry the whole message
+            timestamps = {
+                msg_id: entry.get("timestamp", 0) if isinstance(entry, dict) else entry
+                for msg_id, entry in index.items()
+            }
+            msg_ids = list(timestamps)
+            if limit is not None and len(msg_ids) > limit:
+                msg_ids = heapq.nsmallest(limit, msg_ids, key=lambda msg_id: timestamps[msg_id] or 0)
+            messages_ref = self._db.child("messages")
+            # Bound here, on the caller's thread, so the reads record errors in the caller's context
+            fetches = [_with_error_log(lambda msg_id=msg_id: messages_ref.child(msg_id).get().val()) for msg_id in msg_ids]
+            bodies = self._executor.map(lambda fetch: fetch(), fetches)
+            return {msg_id: body for msg_id, body in zip(msg_ids, bodies) if isinstance(body, dict)}
+
+        messages = {
+            m.key(): m.val() for m in self._legacy_session_messages(session_id).each()
+            if isinstance(m.val(), dict) and m.val().get("session_id") == session_id
+        }
+        if backfill:
+            updates: Dict[str, Any] = {
+                f"messages_by_session/{session_id}/{msg_id}": message.get("timestamp", 0)
+                for msg_id, message in messages.items()
+            }
+            updates[f"messages_by_session/{session_id}/{INDEX_COMPLETE_KEY}"] = True
+            try:
+                self._db.update(updates)
+            except Exception as exc:
+                # The messages were read; the backfill is retried on the next read
+                self._record_error(f"Failed to backfill the message index: {exc}")
+        return messages
+
+    def _legacy_session_messages(self, session_id: str) -> FirebaseSnapshot:
+        """Messages stored only under /messages, filtered server-side when the rules index session_id."""
+        indexed = self._db.child("messages").query("session_id", session_id)
+        if indexed is not None:
+            return indexed
+        return self._db.child("messages").get()
+
+    def get_messages_bulk(self, session_ids: List[str], limit: int = 200,
+                          user_id: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """Fetch messages for several sessions concurrently, keyed by session ID."""
+        if not self.is_configured() or not session_ids:
+            return {}
+        # Each per-session read is an independent request, so fan them out over a bounded pool
+        with ThreadPoolExecutor(max_workers=min(EXPORT_FETCH_WORKERS, len(session_ids))) as executor:
+            # Bound here, on the caller's thread, so the reads record errors in the caller's context
+            fetches = [
+                _with_error_log(functools.partial(self.get_messages, session_id, limit=limit, user_id=user_id))
+                for session_id in session_ids
+            ]
+            results = executor.map(lambda fetch: fetch(), fetches)
+            return dict(zip(session_ids, results))
+
     def _update_session_metadata(self, session_id: str, user_id: Optional[str], 
-                                  metadata: Optional[Dict[str, Any]], timestamp: int) -> None:
-        """Update or create session metadata for tracking sessions."""
+                                  metadata: Optional[Dict[str, Any]], timestamp: int,
+                                  count: int = 1) -> None:
+        """Update or create session metadata for tracking sessions, off the caller's path."""
         if not user_id or user_id == "anonymous":
             return
-        
+        self._write_behind(
+            user_id,
+            lambda: self._apply_session_metadata(session_id, user_id, metadata, timestamp, count)
+        )
+
+    def _remember_session(self, session_key: Tuple[str, str]) -> None:
+        self._known_sessions[session_key] = True
+        self._known_sessions.move_to_end(session_key)
+        if len(self._known_sessions) > KNOWN_SESSIONS_SIZE:
+            self._known_sessions.popitem(last=False)
+
+    def _apply_session_metadata(self, session_id: str, user_id: str,
+                                metadata: Optional[Dict[str, Any]], timestamp: int, count: int) -> None:
         try:
             session_path = self._db.child("sessions").child(user_id).child(session_id)
-            existing = session_path.get()
+            session_key = (user_id, session_id)
             
-            if existing.val():
-                # Update existing session - only update specific fields to avoid race conditions
-                update_data = {
-                    "updated_at": timestamp,
-                }
-                # Only update title if metadata has a new title
-                if metadata and "title" in metadata:
-                    update_data["title"] = metadata["title"]
-                
-                # Get current message count and increment it
-                current_count = existing.val().get("message_count", 0)
-                update_data["message_count"] = current_count + 1
-                
-                session_path.update(update_data)
-            else:
-                # Create new session
-                session_data = {
-                    "session_id": session_id,
-                    "user_id": user_id,
-                    "created_at": timestamp,
-                    "updated_at": timestamp,
-                    "title": metadata.get("title", "Untitled") if metadata else "Untitled",
-                    "message_count": 1
-                }
-                session_path.set(session_data)
+            if session_key not in self._known_sessions:
+                # Only the first write for a session in this process checks whether it exists;
+                # a shallow read fetches just the record's keys
+                if not session_path.get(params={"shallow": "true"}).val():
+                    session_data = {
+                        "session_id": session_id,
+                        "user_id": user_id,
+                        "created_at": timestamp,
+                        "updated_at": timestamp,
+                        "title": metadata.get("title", "Untitled") if metadata else "Untitled",
+                        "message_count": count
+                    }
+                    session_path.set(session_data)
+                    self._remember_session(session_key)
+                    return
+                self._remember_session(session_key)
+            
+            # Existing session - the server increments the count, so no read is needed
+            update_data = {
+                "updated_at": timestamp,
+                "message_count": {".sv": {"increment": count}},
+            }
+            # Only update title if metadata has a new title
+            if metadata and "title" in metadata:
+                update_data["title"] = metadata["title"]
+            session_path.update(update_data)
         except Exception as e:
             self._record_error(f"Error updating session metadata: {e}")
 
@@ -667,16 +1167,15 @@ class FirebaseClient:
     # Session Management
     # ---------------------------------------------------------
 
+    @_requires_user([], [])
     def list_sessions(self, user_id: str, search_term: Optional[str] = None) -> List[Dict[str, Any]]:
         """List all sessions for a user, optionally filtered by search term."""
-        if not self.is_configured():
-            return []
-        if not user_id or user_id == "anonymous":
-            return []
+        # Read our own pending session updates
+        self.wait_for_writes(user_id)
         
         try:
             sessions_data = self._db.child("sessions").child(user_id).get()
-            if not sessions_data.each():
+            if sessions_data.empty():
                 return []
             
             sessions = []
@@ -692,36 +1191,58 @@ class FirebaseClient:
             
             # Sort by updated_at (most recent first)
             sessions.sort(key=lambda x: x.get("updated_at", 0), reverse=True)
-            self._record_error(None)
             return sessions
         except Exception as e:
             self._record_error(f"Error listing sessions: {e}")
             return []
 
-    def export_history(self, user_id: str) -> str:
-        """Export complete chat history for a user as JSON."""
+    def export_history(self, user_id: str, out: Optional[IO[str]] = None) -> Optional[str]:
+        """Export complete chat history for a user as JSON.
+
+        Sessions are fetched and written a batch at a time, so only one batch of messages
+        is held in memory. When ``out`` is given the JSON is written to it and ``None`` is
+        returned; otherwise the JSON string is returned.
+        """
+        buffer = out if out is not None else io.StringIO()
         if not self.is_configured():
-            return json.dumps({"error": "Firebase not configured"}, indent=2)
-        if not user_id or user_id == "anonymous":
-            return json.dumps({"error": "Invalid user ID"}, indent=2)
+            buffer.write(_dumps_indented({"error": "Firebase not configured"}))
+        elif not user_id or user_id == "anonymous":
+            buffer.write(_dumps_indented({"error": "Invalid user ID"}))
+        else:
+            try:
+                self._write_export(user_id, buffer)
+            except Exception as e:
+                self._record_error(f"Error exporting history: {e}")
+                if out is not None:
+                    raise
+                buffer = io.StringIO()
+                buffer.write(_dumps_indented({"error": str(e)}))
+        return buffer.getvalue() if out is None else None
+
+    def _write_export(self, user_id: str, out: IO[str]) -> None:
+        # Get all sessions for the user
+        sessions = self.list_sessions(user_id)
         
-        try:
-            # Get all sessions for the user
-            sessions = self.list_sessions(user_id)
-            
-            export_data = {
-                "user_id": user_id,
-                "export_timestamp": int(time.time()),
-                "total_sessions": len(sessions),
-                "sessions": []
-            }
-            
-            # Get messages for each session
-            for session in sessions:
+        header = _dumps_indented({
+            "user_id": user_id,
+            "export_timestamp": int(time.time()),
+            "total_sessions": len(sessions),
+        })
+        if not sessions:
+            out.write(header[:-2] + ',\n  "sessions": []\n}')
+            return
+        # Reopen the header object and stream each session into its "sessions" array
+        out.write(header[:-2] + ',\n  "sessions": [')
+        for start in range(0, len(sessions), EXPORT_FETCH_WORKERS):
+            batch = sessions[start:start + EXPORT_FETCH_WORKERS]
+            messages_by_session = self.get_messages_bulk(
+                [session.get("session_id") for session in batch], user_id=user_id
+            )
+            for index, session in enumerate(batch, start):
                 session_id = session.get("session_id")
-                messages = self.get_messages(session_id, user_id=user_id)
+                messages = messages_by_session.get(session_id, [])
                 
-                export_data["sessions"].append({
+                session_json = _dumps_indented({
                     "session_id": session_id,
                     "title": session.get("title", "Untitled"),
                     "created_at": session.get("created_at", 0),
@@ -729,32 +1250,28 @@ class FirebaseClient:
                     "message_count": len(messages),
                     "messages": messages
                 })
-            
-            return json.dumps(export_data, indent=2)
-        except Exception as e:
-            self._record_error(f"Error exporting history: {e}")
-            return json.dumps({"error": str(e)}, indent=2)
+                out.write(("," if index else "") + "\n    " + session_json.replace("\n", "\n    "))
+        out.write("\n  ]\n}")
 
+    @_requires_user(False, False)
     def delete_session(self, session_id: str, user_id: str) -> bool:
         """Delete a session and all its messages."""
-        if not self.is_configured():
-            return False
-        if not user_id or user_id == "anonymous":
-            return False
-        
+        # A pending metadata update must not recreate the session after it is deleted
+        self.wait_for_writes(user_id)
         try:
-            # Delete session metadata
-            self._db.child("sessions").child(user_id).child(session_id).remove()
+            # Find the session's messages, including any saved before the index existed
+            message_keys = [
+                key for key, message in self._session_messages(session_id, backfill=False).items()
+                if message.get("user_id") == user_id
+            ]
             
-            # Delete all messages in the session
-            all_msgs = self._db.child("messages").get()
-            if all_msgs.each():
-                for m in all_msgs.each():
-                    msg_val = m.val()
-                    if msg_val.get("session_id") == session_id and msg_val.get("user_id") == user_id:
-                        self._db.child("messages").child(m.key()).remove()
+            # Delete the session metadata, its index and every message in one multi-path update
+            deletes: Dict[str, Any] = {f"messages/{key}": None for key in message_keys}
+            deletes[f"sessions/{user_id}/{session_id}"] = None
+            deletes[f"messages_by_session/{session_id}"] = None
+            self._db.update(deletes)
+            self._known_sessions.pop((user_id, session_id), None)
             
-            self._record_error(None)
             return True
         except Exception as e:
             self._record_error(f"Error deleting session: {e}")
@@ -764,19 +1281,19 @@ class FirebaseClient:
     # Template Management
     # ---------------------------------------------------------
 
+    @_requires_user((False, "Firebase not configured"), (False, "Please login to save templates"))
     def save_template(self, user_id: str, template_name: str, 
                      sections: List[str], description: str = "",
                      is_public: bool = False) -> Tuple[bool, str]:
         """Save a custom template for a user."""
-        if not self.is_configured():
-            return False, "Firebase not configured"
-        if not user_id or user_id == "anonymous":
-            return False, "Please login to save templates"
         if not template_name or not sections:
             return False, "Template name and sections are required"
         
         try:
-            template_id = str(uuid.uuid4())
+            now_ms = time.time_ns() // 1_000_000
+            # Time-prefixed IDs keep the database's key order chronological
+            template_id = _sortable_id(now_ms)
+            now = now_ms // 1000
             template_data = {
                 "template_id": template_id,
                 "template_name": template_name,
@@ -784,54 +1301,90 @@ class FirebaseClient:
                 "description": description,
                 "user_id": user_id,
                 "is_public": is_public,
-                "created_at": int(time.time()),
-                "updated_at": int(time.time()),
+                "created_at": now,
+                "updated_at": now,
             }
             
-            self._db.child("templates").child(user_id).child(template_id).set(template_data)
-            
-            # If public, also add to public templates
+            updates = {f"templates/{user_id}/{template_id}": template_data}
+            # If public, also add to public templates in the same request
             if is_public:
-                self._db.child("public_templates").child(template_id).set(template_data)
+                updates[f"public_templates/{template_id}"] = template_data
+            self._db.update(updates)
             
-            self._record_error(None)
             return True, f"Template '{template_name}' saved successfully"
         except Exception as e:
             self._record_error(f"Error saving template: {e}")
             return False, f"Failed to save template: {str(e)}"
+        finally:
+            self._invalidate_templates()
+
+    def _cached_template_read(self, key: Tuple[Any, ...]) -> Any:
+        with self._template_lock:
+            entry = self._template_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._template_cache[key]
+                return None
+            self._template_cache.move_to_end(key)
+            return entry[1]
+
+    def _store_template_read(self, key: Tuple[Any, ...], value: Any, ttl: float) -> None:
+        with self._template_lock:
+            self._template_cache[key] = (time.time() + ttl, value)
+            self._template_cache.move_to_end(key)
+            while len(self._template_cache) > TEMPLATE_CACHE_SIZE:
+                self._template_cache.popitem(last=False)
+
+    def _invalidate_templates(self) -> None:
+        # Public templates appear in every user's listing, so any write clears every entry
+        with self._template_lock:
+            self._template_cache.clear()
 
     def list_templates(self, user_id: str, include_public: bool = True) -> List[Dict[str, Any]]:
         """List all templates for a user, optionally including public templates."""
         if not self.is_configured():
             return []
         
-        templates = []
+        cache_key = ("list", user_id, include_public)
+        cached = self._cached_template_read(cache_key)
+        if cached is not None:
+            # Copies keep callers' annotations out of the shared cache
+            return [dict(template) for template in cached]
+        
+        # Keyed by template_id, so the user's own public templates are listed once
+        templates: Dict[str, Dict[str, Any]] = {}
         
         try:
+            # The public listing does not depend on the user's templates, so read both at once
+            public_future = (
+                self._executor.submit(_with_error_log(self._db.child("public_templates").get))
+                if include_public else None
+            )
+            
             # Get user's private templates
             if user_id and user_id != "anonymous":
                 user_templates = self._db.child("templates").child(user_id).get()
-                if user_templates.each():
+                if not user_templates.empty():
                     for template in user_templates.each():
                         template_val = template.val()
                         if template_val:
-                            templates.append(template_val)
+                            templates[template.key()] = template_val
             
             # Get public templates
-            if include_public:
-                public_templates = self._db.child("public_templates").get()
-                if public_templates.each():
+            if public_future is not None:
+                public_templates = public_future.result()
+                if not public_templates.empty():
                     for template in public_templates.each():
                         template_val = template.val()
-                        # Don't include user's own public templates twice
-                        if template_val and template_val.get("user_id") != user_id:
+                        if template_val and template.key() not in templates:
                             template_val["is_public_shared"] = True
-                            templates.append(template_val)
+                            templates[template.key()] = template_val
             
             # Sort by updated_at (most recent first)
-            templates.sort(key=lambda x: x.get("updated_at", 0), reverse=True)
-            self._record_error(None)
-            return templates
+            ordered = sorted(templates.values(), key=lambda x: x.get("updated_at", 0), reverse=True)
+            self._store_template_read(cache_key, ordered, TEMPLATE_LIST_TTL)
+            return [dict(template) for template in ordered]
         except Exception as e:
             self._record_error(f"Error listing templates: {e}")
             return []
@@ -841,94 +1394,116 @@ class FirebaseClient:
         if not self.is_configured():
             return None
         
+        cache_key = ("template", template_id, user_id)
+        cached = self._cached_template_read(cache_key)
+        if cached is not None:
+            return dict(cached)
+        
         try:
+            template_val = None
             # Try user's templates first
             if user_id and user_id != "anonymous":
-                template = self._db.child("templates").child(user_id).child(template_id).get()
-                if template.val():
-                    return template.val()
+                template_val = self._db.child("templates").child(user_id).child(template_id).get().val()
             
             # Try public templates
-            public_template = self._db.child("public_templates").child(template_id).get()
-            if public_template.val():
-                return public_template.val()
+            if not template_val:
+                template_val = self._db.child("public_templates").child(template_id).get().val()
             
-            return None
+            if not template_val:
+                return None
+            self._store_template_read(cache_key, template_val, TEMPLATE_TTL)
+            return dict(template_val)
         except Exception as e:
             self._record_error(f"Error getting template: {e}")
             return None
 
+    @_requires_user(False, False)
     def delete_template(self, template_id: str, user_id: str) -> bool:
         """Delete a user's template."""
-        if not self.is_configured():
-            return False
-        if not user_id or user_id == "anonymous":
-            return False
-        
         try:
-            # Get the template to check if it's public
-            template = self._db.child("templates").child(user_id).child(template_id).get()
-            if template.val() and template.val().get("is_public"):
+            # Read only the is_public flag, not the whole template
+            is_public = self._db.child("templates").child(user_id).child(template_id).child("is_public").get().val()
+            deletes: Dict[str, Any] = {f"templates/{user_id}/{template_id}": None}
+            if is_public:
                 # Also delete from public templates
-                self._db.child("public_templates").child(template_id).remove()
+                deletes[f"public_templates/{template_id}"] = None
             
-            # Delete from user's templates
-            self._db.child("templates").child(user_id).child(template_id).remove()
+            # Delete from user's (and public) templates in one request
+            self._db.update(deletes)
             return True
         except Exception as e:
             self._record_error(f"Error deleting template: {e}")
             return False
+        finally:
+            self._invalidate_templates()
 
+    @_requires_user((False, "Firebase not configured"), (False, "Invalid user ID"))
     def update_template(self, template_id: str, user_id: str, 
                        template_name: Optional[str] = None,
                        sections: Optional[List[str]] = None,
                        description: Optional[str] = None,
                        is_public: Optional[bool] = None) -> Tuple[bool, str]:
         """Update an existing template."""
-        if not self.is_configured():
-            return False, "Firebase not configured"
-        if not user_id or user_id == "anonymous":
-            return False, "Invalid user ID"
-        
         try:
             template_path = self._db.child("templates").child(user_id).child(template_id)
-            existing = template_path.get()
-            
-            if not existing.val():
+            # Every template stores is_public, so this one-field read doubles as the existence check
+            currently_public = template_path.child("is_public").get().val()
+            if currently_public is None:
                 return False, "Template not found"
             
-            template_data = existing.val()
-            template_data["updated_at"] = int(time.time())
-            
+            changes: Dict[str, Any] = {"updated_at": int(time.time())}
             if template_name is not None:
-                template_data["template_name"] = template_name
+                changes["template_name"] = template_name
             if sections is not None:
-                template_data["sections"] = sections
+                changes["sections"] = sections
             if description is not None:
-                template_data["description"] = description
+                changes["description"] = description
             if is_public is not None:
-                template_data["is_public"] = is_public
-                
-                # Update public templates accordingly
-                if is_public:
-                    self._db.child("public_templates").child(template_id).set(template_data)
-                else:
-                    self._db.child("public_templates").child(template_id).remove()
+                changes["is_public"] = is_public
+            
+            # Patch only the changed fields, keeping the public copy in step, in one request
+            private_prefix = f"templates/{user_id}/{template_id}"
+            updates = {f"{private_prefix}/{field}": value for field, value in changes.items()}
+            if is_public and not currently_public:
+                # Becoming public needs the full record to create the public copy
+                template_data = template_path.get().val() or {}
+                template_data.update(changes)
+                updates[f"public_templates/{template_id}"] = template_data
+            elif is_public is False and currently_public:
+                updates[f"public_templates/{template_id}"] = None
+            elif currently_public:
+                updates.update({f"public_templates/{template_id}/{field}": value for field, value in changes.items()})
             
-            template_path.set(template_data)
-            self._record_error(None)
+            self._db.update(updates)
             return True, "Template updated successfully"
         except Exception as e:
             self._record_error(f"Error updating template: {e}")
             return False, f"Failed to update template: {str(e)}"
+        finally:
+            self._invalidate_templates()
 
-    def _record_error(self, message: Optional[str]) -> None:
-        self._last_error = message
+    def _record_error(self, message: str) -> None:
+        # Warnings accumulate until drain_errors() or pop_last_error() hands them to the UI;
+        # a later successful call must not discard them first
+        _error_log().append(message)
+
+    def _record_shared_error(self, message: str) -> None:
+        with self._shared_errors_lock:
+            self._shared_errors.append(message)
 
     def pop_last_error(self) -> Optional[str]:
-        err = self._last_error
-        self._last_error = None
-        return err
+        errors = self.drain_errors()
+        return errors[-1] if errors else None
+
+    def drain_errors(self) -> List[str]:
+        with self._shared_errors_lock:
+            drained = self._shared_errors[:]
+            self._shared_errors.clear()
+        # Clear in place: background work bound to this context shares the same list
+        errors = _error_log()
+        drained.extend(errors)
+        errors.clear()
+        return drained
 
 
 # ---------------------------------------------------------
@@ -937,31 +1512,89 @@ class FirebaseClient:
 
 client = FirebaseClient()
 
-# Authentication wrappers
-def register_user(*args, **kwargs): return client.register_user(*args, **kwargs)
-def authenticate_user(*args, **kwargs): return client.authenticate_user(*args, **kwargs)
-def authenticate_with_google(*args, **kwargs): return client.authenticate_with_google(*args, **kwargs)
-def supports_google_auth(): return client.supports_google_auth()
-def get_google_auth_url(*args, **kwargs): return client.get_google_auth_url(*args, **kwargs)
-def exchange_code_for_token(*args, **kwargs): return client.exchange_code_for_token(*args, **kwargs)
-def create_persistent_session(*args, **kwargs): return client.create_persistent_session(*args, **kwargs)
-def resume_session(*args, **kwargs): return client.resume_session(*args, **kwargs)
-def delete_persistent_session(*args, **kwargs): return client.delete_persistent_session(*args, **kwargs)
-
-# Message and session wrappers
-def save_message(*args, **kwargs): return client.save_message(*args, **kwargs)
-def get_messages(*args, **kwargs): return client.get_messages(*args, **kwargs)
-def list_sessions(*args, **kwargs): return client.list_sessions(*args, **kwargs)
-def export_history(*args, **kwargs): return client.export_history(*args, **kwargs)
-def delete_session(*args, **kwargs): return client.delete_session(*args, **kwargs)
-
-# Template management wrappers
-def save_template(*args, **kwargs): return client.save_template(*args, **kwargs)
-def list_templates(*args, **kwargs): return client.list_templates(*args, **kwargs)
-def get_template(*args, **kwargs): return client.get_template(*args, **kwargs)
-def delete_template(*args, **kwargs): return client.delete_template(*args, **kwargs)
-def update_template(*args, **kwargs): return client.update_template(*args, **kwargs)
 
+@atexit.register
+def _wait_for_client_writes() -> None:
+    """Give the current client's queued writes a bounded chance to land before exit.
+
+    Registered once for the module, so clients replaced by set_client() neither stay
+    alive for the hook nor add their own wait at exit.
+    """
+    client.wait_for_writes()
+
+# Module-level helpers are the global client's bound methods, so calls skip an extra
+# wrapper frame and argument repacking. set_client() rebinds the same names; a helper
+# imported with ``from firebase_client import ...`` keeps the client it was imported with.
+# Authentication
+register_user = client.register_user
+authenticate_user = client.authenticate_user
+authenticate_with_google = client.authenticate_with_google
+supports_google_auth = client.supports_google_auth
+get_google_auth_url = client.get_google_auth_url
+exchange_code_for_token = client.exchange_code_for_token
+create_persistent_session = client.create_persistent_session
+resume_session = client.resume_session
+delete_persistent_session = client.delete_persistent_session
+flush_session_end = client.flush_session_end
+# Messages and sessions
+save_message = client.save_message
+save_messages = client.save_messages
+get_messages = client.get_messages
+get_messages_bulk = client.get_messages_bulk
+list_sessions = client.list_sessions
+export_history = client.export_history
+delete_session = client.delete_session
+# Template management
+save_template = client.save_template
+list_templates = client.list_templates
+get_template = client.get_template
+delete_template = client.delete_template
+update_template = client.update_template
 # Configuration check
-def is_configured(): return client.is_configured()
-def pop_last_error(): return client.pop_last_error()
+is_configured = client.is_configured
+warmup = client.warmup
+wait_for_writes = client.wait_for_writes
+pop_last_error = client.pop_last_error
+drain_errors = client.drain_errors
+
+
+def set_client(new_client: FirebaseClient) -> None:
+    """Replace the global client and rebind the module-level helpers to it."""
+    global client, register_user, authenticate_user, authenticate_with_google, supports_google_auth
+    global get_google_auth_url, exchange_code_for_token, create_persistent_session, resume_session
+    global delete_persistent_session, flush_session_end, save_message, save_messages, get_messages
+    global get_messages_bulk, list_sessions, export_history, delete_session, save_template
+    global list_templates, get_template, delete_template, update_template, is_configured, warmup
+    global wait_for_writes, pop_last_error, drain_errors
+    client = new_client
+    # Authentication
+    register_user = new_client.register_user
+    authenticate_user = new_client.authenticate_user
+    authenticate_with_google = new_client.authenticate_with_google
+    supports_google_auth = new_client.supports_google_auth
+    get_google_auth_url = new_client.get_google_auth_url
+    exchange_code_for_token = new_client.exchange_code_for_token
+    create_persistent_session = new_client.create_persistent_session
+    resume_session = new_client.resume_session
+    delete_persistent_session = new_client.delete_persistent_session
+    flush_session_end = new_client.flush_session_end
+    # Messages and sessions
+    save_message = new_client.save_message
+    save_messages = new_client.save_messages
+    get_messages = new_client.get_messages
+    get_messages_bulk = new_client.get_messages_bulk
+    list_sessions = new_client.list_sessions
+    export_history = new_client.export_history
+    delete_session = new_client.delete_session
+    # Template management
+    save_template = new_client.save_template
+    list_templates = new_client.list_templates
+    get_template = new_client.get_template
+    delete_template = new_client.delete_template
+    update_template = new_client.update_template
+    # Configuration check
+    is_configured = new_client.is_configured
+    warmup = new_client.warmup
+    wait_for_writes = new_client.wait_for_writes
+    pop_last_error = new_client.pop_last_error
+    drain_errors = new_client.drain_errors
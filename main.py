@@ -1,11 +1,22 @@
+import asyncio
+import functools
 import os
+import re
+import threading
 import streamlit as st
+import pandas as pd
 import google.generativeai as genai
 import uuid
 import json
+import time
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 st.set_page_config(page_title="Write Wise - AI Content Generator", layout="wide", page_icon="✍️")
 
 # ------------------------------
@@ -16,167 +27,210 @@ if not GEMINI_API_KEY:
     st.error("GEMINI_API_KEY not found in Streamlit secrets.")
     st.stop()
 
-genai.configure(api_key=GEMINI_API_KEY)
+@st.cache_resource(show_spinner=False)
+def _configure_genai(api_key: str) -> bool:
+    """Configure the Gemini SDK once per process and key, not on every rerun."""
+    genai.configure(api_key=api_key)
+    return True
+
+_configure_genai(GEMINI_API_KEY)
 
 # ------------------------------
 # Local Storage Helper Functions
 # ------------------------------
-def init_local_storage():
-    """Initialize local storage using Streamlit's session state and HTML5 localStorage."""
-    # JavaScript to sync localStorage with Streamlit
-    storage_js = """
-    <script>
-    // Function to save data to localStorage
-    function saveToLocalStorage(key, value) {
-        localStorage.setItem(key, JSON.stringify(value));
-    }
-    
-    // Function to load data from localStorage
-    function loadFromLocalStorage(key) {
-        const item = localStorage.getItem(key);
-        return item ? JSON.parse(item) : null;
-    }
-    
-    // Load data on page load
-    window.addEventListener('load', function() {
-        const sessions = loadFromLocalStorage('writewise_sessions');
-        const templates = loadFromLocalStorage('writewise_templates');
-        const currentSession = loadFromLocalStorage('writewise_current_session');
-        
-        // Send data to Streamlit
-        if (sessions) {
-            window.parent.postMessage({
-                type: 'streamlit:setComponentValue',
-                data: { sessions: sessions }
-            }, '*');
-        }
-    });
-    </script>
-    """
-    st.components.v1.html(storage_js, height=0)
+def _dumps(data: Any, indent: bool = False) -> str:
+    """Serialize to JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else None).decode("utf-8")
+    if indent:
+        return json.dumps(data, indent=2)
+    # Stored data is machine-read, so drop the separator whitespace
+    return json.dumps(data, separators=(",", ":"))
 
-def save_to_local_storage(key: str, data: Any):
-    """Save data to browser's localStorage via JavaScript."""
-    json_data = json.dumps(data)
-    escaped_data = json_data.replace("'", "\\'").replace('"', '\\"')
-    
-    js_code = f"""
-    <script>
-    localStorage.setItem('{key}', '{escaped_data}');
-    </script>
-    """
-    st.components.v1.html(js_code, height=0)
-
-def get_from_session_or_init(key: str, default: Any) -> Any:
-    """Get data from session state or initialize with default."""
-    if key not in st.session_state:
-        st.session_state[key] = default
-    return st.session_state[key]
+def _run_script(html: str):
+    """Run a <script> snippet inline in the page, without a component iframe."""
+    st.html(html, unsafe_allow_javascript=True)
 
 # ------------------------------
 # Initialize Session State
 # ------------------------------
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-if "templates" not in st.session_state:
-    st.session_state.templates = {}
-if "current_page" not in st.session_state:
-    st.session_state.current_page = "generator"
-if "selected_template" not in st.session_state:
-    st.session_state.selected_template = None
-if "custom_sections" not in st.session_state:
-    st.session_state.custom_sections = None
-if "main_topic" not in st.session_state:
-    st.session_state.main_topic = None
-if "additional_context" not in st.session_state:
-    st.session_state.additional_context = None
-if "section_results" not in st.session_state:
-    st.session_state.section_results = {}
-if "generation_mode" not in st.session_state:
-    st.session_state.generation_mode = None
-if "structure_selection_message" not in st.session_state:
-    st.session_state.structure_selection_message = None
-if "initialized" not in st.session_state:
-    st.session_state.initialized = False
-
-# Load from localStorage on first run
-if not st.session_state.initialized:
-    # Try to load persisted data
-    load_js = """
-    <script>
-    function loadData() {
-        const sessions = localStorage.getItem('writewise_sessions');
-        const templates = localStorage.getItem('writewise_templates');
-        
-        if (sessions || templates) {
-            const data = {
-                sessions: sessions ? JSON.parse(sessions) : {},
-                templates: templates ? JSON.parse(templates) : {}
-            };
-            
-            // Pass data to Streamlit via query params or session
-            console.log('Loaded data:', data);
-        }
-    }
-    loadData();
-    </script>
-    """
-    st.components.v1.html(load_js, height=0)
-    st.session_state.initialized = True
+# Number of messages the history page renders per "Show more" step
+HISTORY_PAGE_SIZE = 20
+# Characters of a message shown on the history page until it is expanded
+CONTENT_PREVIEW_LENGTH = 300
+# Display formats for message and template times
+MESSAGE_TIME_FORMAT = "%Y-%m-%d %H:%M"
+TEMPLATE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_SESSION_DEFAULTS = {
+    "current_page": "generator",
+    "selected_template": None,
+    "custom_sections": None,
+    "main_topic": None,
+    "additional_context": None,
+    "generation_mode": None,
+    "structure_selection_message": None,
+    "history_shown": HISTORY_PAGE_SIZE,
+    "templates_dirty": False,
+    "templates_version": 0,
+    "last_output_timestamp": None,
+}
+
+for _key, _value in _SESSION_DEFAULTS.items():
+    st.session_state.setdefault(_key, _value)
+# Defaults that are per-session objects
+st.session_state.setdefault("chat_history", [])
+st.session_state.setdefault("templates", {})
+st.session_state.setdefault("section_results", {})
+st.session_state.setdefault("pending_history", [])
+st.session_state.setdefault("viewing_messages", set())
 
 # ------------------------------
 # Data Persistence Functions
 # ------------------------------
+# Chat messages are stored as JSON Lines so each new message is a single append
+CHAT_HISTORY_KEY = "writewise_chat_history_jsonl"
+# Most recent messages kept in session state; older ones remain only in the localStorage log
+MAX_HISTORY_IN_MEMORY = 500
+# Longest, in milliseconds, the browser may hold localStorage writes back for an idle period
+LOCAL_STORAGE_FLUSH_TIMEOUT_MS = 500
+
+def _content_preview(content: str) -> str:
+    """Shorten a message to the history-page preview length."""
+    if len(content) > CONTENT_PREVIEW_LENGTH:
+        return content[:CONTENT_PREVIEW_LENGTH] + "..."
+    return content
+
+def _format_timestamp(timestamp: Optional[float], fmt: str) -> str:
+    """Format an epoch timestamp for display, returning "" when it is missing or invalid."""
+    if not timestamp:
+        return ""
+    try:
+        return datetime.fromtimestamp(timestamp).strftime(fmt)
+    except Exception:
+        return ""
+
 def save_message(role: str, content: str, metadata: Optional[Dict[str, Any]] = None):
     """Save a message to the chat history."""
-    timestamp = datetime.now().timestamp()
+    # Integer nanoseconds give each message a unique, sortable id; seconds are kept for display
+    ts_ns = time.time_ns()
     message = {
         "role": role,
         "content": content,
-        "timestamp": timestamp,
-        "metadata": metadata or {}
+        "timestamp": ts_ns / 1e9,
+        "ts_ns": ts_ns,
+        "metadata": metadata or {},
+        "preview": _content_preview(content),
+        # Formatted once here rather than on every history render
+        "ts_str": _format_timestamp(ts_ns / 1e9, MESSAGE_TIME_FORMAT),
     }
     
-    # Add to chat history
-    st.session_state.chat_history.append(message)
+    # Add to chat history, dropping the oldest messages past the in-memory cap
+    history = st.session_state.chat_history
+    history.append(message)
+    if len(history) > MAX_HISTORY_IN_MEMORY:
+        del history[:-MAX_HISTORY_IN_MEMORY]
     
-    # Persist to localStorage
-    persist_chat_history()
+    # Queue for localStorage; flushed once at the end of the run
+    st.session_state.pending_history.append(message)
 
 
-def persist_chat_history():
-    """Persist chat history to localStorage."""
-    chat_json = json.dumps(st.session_state.chat_history)
-    js_code = f"""
-    <script>
-    localStorage.setItem('writewise_chat_history', '{chat_json.replace("'", "\\'")}');
-    </script>
-    """
-    st.components.v1.html(js_code, height=0)
+def _js_string(value: str) -> str:
+    """Quote a Python string as a JavaScript string literal safe to embed in a <script> tag."""
+    quoted = orjson.dumps(value).decode("utf-8") if orjson is not None else json.dumps(value)
+    return quoted.replace("</", "<\\/")
+
+def flush_local_storage():
+    """Write this run's queued messages and template changes to localStorage in one script."""
+    statements = []
+    pending = st.session_state.pending_history
+    if pending:
+        # Chat messages are appended to the JSON Lines log
+        lines = _js_string("".join(_dumps(message) + "\n" for message in pending))
+        st.session_state.pending_history = []
+        statements.append(
+            f"localStorage.setItem('{CHAT_HISTORY_KEY}', (localStorage.getItem('{CHAT_HISTORY_KEY}') || '') + {lines});"
+        )
+    if st.session_state.templates_dirty:
+        # Templates are serialized once, however many changes the run made
+        templates_json = _js_string(_dumps(st.session_state.templates))
+        st.session_state.templates_dirty = False
+        statements.append(f"localStorage.setItem('writewise_templates', {templates_json});")
+    if not statements:
+        return
+    # Deferred to an idle period so the writes never compete with the page rendering this run.
+    # The Python side has already cleared its queue, so a busy or background tab must not postpone
+    # the writes indefinitely: they run after the timeout at the latest, or when the page is hidden.
+    js_code = (
+        "<script>\n(function () {\n"
+        "var flushed = false;\n"
+        "function flush() {\n"
+        "if (flushed) { return; }\n"
+        "flushed = true;\n"
+        "window.removeEventListener('pagehide', flush);\n"
+        + "\n".join(statements)
+        + "\n}\n"
+        "window.addEventListener('pagehide', flush);\n"
+        "if (window.requestIdleCallback) {\n"
+        f"window.requestIdleCallback(flush, {{timeout: {LOCAL_STORAGE_FLUSH_TIMEOUT_MS}}});\n"
+        "} else {\n"
+        "window.setTimeout(flush, 0);\n"
+        "}\n"
+        "})();\n</script>"
+    )
+    _run_script(js_code)
 
 def persist_templates():
-    """Persist templates to localStorage."""
-    templates_json = json.dumps(st.session_state.templates)
-    js_code = f"""
-    <script>
-    localStorage.setItem('writewise_templates', '{templates_json.replace("'", "\\'")}');
-    </script>
-    """
-    st.components.v1.html(js_code, height=0)
+    """Mark templates for the localStorage write at the end of the run."""
+    st.session_state.templates_dirty = True
+    # Every template change comes through here, so this also invalidates filtered_templates
+    st.session_state.templates_version += 1
+
+def filtered_templates(query: str) -> List[Dict[str, Any]]:
+    """Return templates matching a lowercased query, newest first, reusing the last result."""
+    key = (st.session_state.templates_version, query)
+    cached = st.session_state.get("filtered_templates_cache")
+    if cached and cached[0] == key:
+        return cached[1]
+    templates = st.session_state.templates.values()
+    if query:
+        templates = [
+            t for t in templates
+            if query in t.get("template_name", "").lower() or query in t.get("description", "").lower()
+        ]
+    # Sort by updated_at
+    result = sorted(templates, key=lambda t: t.get("updated_at", 0), reverse=True)
+    st.session_state.filtered_templates_cache = (key, result)
+    return result
+
+def chat_history_json() -> str:
+    """Serialize the chat history, reusing the last result while it is unchanged."""
+    history = st.session_state.chat_history
+    # History only grows or is cleared, so its length and newest timestamp identify a version
+    version = (len(history), history[-1].get("timestamp") if history else None)
+    cached = st.session_state.get("chat_history_json_cache")
+    if cached and cached[0] == version:
+        return cached[1]
+    history_json = _dumps(history, indent=True)
+    st.session_state.chat_history_json_cache = (version, history_json)
+    return history_json
 
 def clear_chat_history():
     """Clear all chat history."""
     st.session_state.chat_history = []
-    js_code = """
+    st.session_state.pending_history = []
+    st.session_state.viewing_messages.clear()
+    js_code = f"""
     <script>
     localStorage.removeItem('writewise_chat_history');
+    localStorage.removeItem('{CHAT_HISTORY_KEY}');
     </script>
     """
-    st.components.v1.html(js_code, height=0)
+    _run_script(js_code)
 
 def save_template(template_name: str, sections: List[str], description: str = ""):
     """Save a custom template."""
-    template_id = str(uuid.uuid4())
+    template_id = uuid.uuid4().hex
     timestamp = datetime.now().timestamp()
     
     st.session_state.templates[template_id] = {
@@ -185,7 +239,8 @@ def save_template(template_name: str, sections: List[str], description: str = ""
         "sections": sections,
         "description": description,
         "created_at": timestamp,
-        "updated_at": timestamp
+        "updated_at": timestamp,
+        "updated_at_str": _format_timestamp(timestamp, TEMPLATE_TIME_FORMAT),
     }
     
     persist_templates()
@@ -208,6 +263,7 @@ def update_template(template_id: str, template_name: Optional[str] = None,
     
     template = st.session_state.templates[template_id]
     template["updated_at"] = datetime.now().timestamp()
+    template["updated_at_str"] = _format_timestamp(template["updated_at"], TEMPLATE_TIME_FORMAT)
     
     if template_name is not None:
         template["template_name"] = template_name
@@ -277,6 +333,15 @@ EXAMPLE_STRUCTURES = {
     ]
 }
 
+def _numbered_markdown(sections: List[str]) -> str:
+    """Render sections as a single numbered markdown list."""
+    return "\n".join(f"{i}. {section}" for i, section in enumerate(sections, 1))
+
+@st.cache_data(show_spinner=False)
+def _rendered_example_structures() -> Dict[str, str]:
+    """Pre-render the numbered section list for each example structure."""
+    return {name: _numbered_markdown(sections) for name, sections in EXAMPLE_STRUCTURES.items()}
+
 # ------------------------------
 # Theme/Tone Presets
 # ------------------------------
@@ -298,9 +363,230 @@ FORMAT_OPTIONS = {
     "Mixed": "Use a combination of paragraphs, lists, and tables as appropriate for the content.",
 }
 
+# ------------------------------
+# Content Depth Options
+# ------------------------------
+DEPTH_INSTRUCTIONS = {
+    "Shallow (high-level overview)": "Provide a clear and simple overview. Focus on key points, avoid unnecessary details.",
+    "Medium (moderate detail with examples)": "Provide a moderately detailed explanation with examples and supporting points.",
+    "Deep (very detailed, nuanced, in-depth analysis)": "Provide an in-depth, thorough, and nuanced explanation. Include examples, multiple perspectives, reasoning, and insights."
+}
+DEPTH_CHOICES = tuple(DEPTH_INSTRUCTIONS)
+TONE_CHOICES = tuple(TONE_PRESETS)
+FORMAT_CHOICES = tuple(FORMAT_OPTIONS)
+
+# ------------------------------
+# Gemini Models
+# ------------------------------
+DEFAULT_SYSTEM_INSTRUCTION = "You are AiGuru, a professional AI content generator."
+STRUCTURED_SYSTEM_INSTRUCTION = """You are a professional content generator. Generate a comprehensive, well-structured document based on the provided structure.
+
+For each section:
+- Write detailed, relevant content specific to that section
+- Maintain consistency in tone and style throughout
+- Use proper formatting with clear headings
+- Include examples, data, or explanations as appropriate for each section
+- Ensure smooth transitions between sections
+
+Format your response with clear section headers (use ## for section titles) so each part is easily identifiable."""
+
+SYSTEM_PROMPT_TEMPLATE = """
+{base_system_instruction}
+
+CONTENT DEPTH: {depth_instruction}
+TONE & STYLE: {tone_instruction}
+OUTPUT FORMAT: {format_instruction}
+
+{task}
+"""
+SECTION_TASK = "Generate high-quality content for this specific section. Focus on relevance, clarity, and completeness."
+GROUPED_SECTION_TASK = "Generate high-quality content for each of the listed sections, keeping each one focused on its own section. Focus on relevance, clarity, and completeness."
+DOCUMENT_TASK = """Your task is to generate high-quality content based on the user's prompt.
+Use proper grammar and structure, adapt tone appropriately, include headings or examples if needed, and avoid filler or repetition."""
+
+@st.cache_data(show_spinner=False)
+def build_system_prompt(base_system_instruction: str, depth_choice: str, tone_choice: str,
+                        format_choice: str, task: str) -> str:
+    """Assemble the system prompt for one combination of generator options."""
+    return SYSTEM_PROMPT_TEMPLATE.format(
+        base_system_instruction=base_system_instruction,
+        depth_instruction=DEPTH_INSTRUCTIONS[depth_choice],
+        tone_instruction=TONE_PRESETS[tone_choice],
+        format_instruction=FORMAT_OPTIONS[format_choice],
+        task=task,
+    )
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def build_structured_prompt(main_topic: str, sections: tuple, additional_context: str,
+                            custom_prompt: str) -> str:
+    """Assemble the user prompt for generating a whole structured document."""
+    prompt_parts = [f"Topic: {main_topic}\n\n"]
+    if custom_prompt:
+        prompt_parts.append(f"Prompt: {custom_prompt}\n\n")
+    if additional_context:
+        prompt_parts.append(f"Context: {additional_context}\n\n")
+    prompt_parts.append("Please generate comprehensive content for the following document structure:\n\n")
+    prompt_parts.extend(f"{i}. {section}\n" for i, section in enumerate(sections, 1))
+    return "".join(prompt_parts)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def compile_document(main_topic: str, sections: tuple, results_items: tuple) -> str:
+    """Join the generated sections into one Markdown document, in structure order."""
+    results = dict(results_items)
+    document_parts = [f"# {main_topic}\n\n"]
+    for i, section in enumerate(sections, 1):
+        document_parts.append(f"## {i}. {section}\n\n")
+        document_parts.append(results.get(section, "[Content not generated yet]") + "\n\n")
+    return "".join(document_parts)
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def get_model(model_name: str, system_instruction: str):
+    """Build a Gemini model once per (model, system prompt) and reuse it across reruns."""
+    return genai.GenerativeModel(
+        model_name=model_name,
+        system_instruction=system_instruction
+    )
+
+def _extract_parts(chunk) -> str:
+    """Extract the text carried by a Gemini response or one streamed chunk of it."""
+    # Single-candidate responses expose their text directly; only walk the parts when that fails
+    try:
+        text = chunk.text
+    except (AttributeError, ValueError):
+        text = None
+    if text:
+        return text
+    parts_out = []
+    for candidate in getattr(chunk, "candidates", None) or ():
+        content = getattr(candidate, "content", None)
+        if content and getattr(content, "parts", None):
+            parts_out.extend(getattr(part, "text", "") for part in content.parts)
+    return "".join(parts_out)
+
+SECTION_CONCURRENCY = 8
+SECTIONS_PER_CALL = 3
+SECTION_MARKER = re.compile(r"<<<SECTION:\s*(.*?)>>>")
+SECTION_END = "<<<END>>>"
+
+def split_sections(output_text: str) -> Dict[str, str]:
+    """Split a grouped response into its ``<<<SECTION: name>>>`` blocks, keyed by section name.
+
+    Blocks without their end marker were cut off, e.g. by the output token limit, and are left out.
+    """
+    blocks = {}
+    pieces = SECTION_MARKER.split(output_text)
+    # pieces alternates [preamble, name, body, name, body, ...]
+    for name, body in zip(pieces[1::2], pieces[2::2]):
+        body, terminated, _ = body.partition(SECTION_END)
+        body = body.strip()
+        if terminated and body:
+            blocks[name.strip()] = body
+    return blocks
+
+@st.cache_resource(show_spinner=False)
+def _async_loop() -> asyncio.AbstractEventLoop:
+    """A long-lived event loop thread; the SDK's async client stays bound to one loop."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+async def _generate_sections_async(model, section_prompts: Dict[Any, str],
+                                   max_output_tokens: int = 8000) -> Dict[Any, Any]:
+    """Run the prompts concurrently, at most ``SECTION_CONCURRENCY`` at a time.
+
+    Failed calls come back as exceptions in place of the response text.
+    """
+    semaphore = asyncio.Semaphore(SECTION_CONCURRENCY)
+
+    async def generate_one(section_prompt: str) -> str:
+        async with semaphore:
+            response = await model.generate_content_async(
+                section_prompt,
+                generation_config={
+                    "max_output_tokens": max_output_tokens,
+                    "temperature": 0.35
+                },
+            )
+        return _extract_parts(response)
+
+    outputs = await asyncio.gather(
+        *(generate_one(section_prompt) for section_prompt in section_prompts.values()),
+        return_exceptions=True,
+    )
+    return dict(zip(section_prompts, outputs))
+
+STREAM_RENDER_INTERVAL = 0.15
+
+def stream_markdown(response, placeholder) -> str:
+    """Render a streamed Gemini response into ``placeholder`` as it arrives and return the full text."""
+    chunks = []
+    rendered_at = 0.0
+    rendered_count = 0
+    for chunk in response:
+        text = _extract_parts(chunk)
+        if text:
+            chunks.append(text)
+            # Re-rendering the growing document per chunk costs more than the chunk; batch the updates
+            now = time.monotonic()
+            if now - rendered_at >= STREAM_RENDER_INTERVAL:
+                placeholder.markdown("".join(chunks))
+                rendered_at = now
+                rendered_count = len(chunks)
+    output_text = "".join(chunks)
+    if rendered_count != len(chunks):
+        placeholder.markdown(output_text)
+    return output_text
+
 # ------------------------------
 # History Viewer
 # ------------------------------
+@st.fragment
+def _render_history_message(msg: Dict[str, Any]) -> None:
+    """Render one history message; its View/Hide toggle reruns only this message."""
+    role = msg.get("role", "assistant").lower()
+    content = msg.get("content", "")
+    # Messages saved before previews existed get theirs on first display
+    preview = msg.get("preview")
+    if preview is None:
+        preview = msg["preview"] = _content_preview(content)
+    timestamp = msg.get("timestamp")
+    # Likewise for the formatted time
+    msg_timestamp = msg.get("ts_str")
+    if msg_timestamp is None:
+        msg_timestamp = msg["ts_str"] = _format_timestamp(timestamp, MESSAGE_TIME_FORMAT)
+    
+    # Only send a preview to the browser until the full message is requested
+    view_key = msg.get("ts_ns") or f"{timestamp}_{role}"
+    is_open = view_key in st.session_state.viewing_messages
+    is_truncated = len(content) > CONTENT_PREVIEW_LENGTH and not is_open
+    if is_truncated:
+        content = preview
+    
+    if role == "user":
+        speaker = "🧑‍💻 You"
+        if msg_timestamp:
+            st.markdown(f"**{speaker}** ({msg_timestamp})")
+        else:
+            st.markdown(f"**{speaker}**")
+        st.info(content)
+    else:
+        speaker = "🤖 AI"
+        if msg_timestamp:
+            st.markdown(f"**{speaker}** ({msg_timestamp})")
+        else:
+            st.markdown(f"**{speaker}**")
+        st.success(content)
+    
+    # Callbacks update the toggle before the rerun the click already triggers
+    if is_truncated:
+        st.button("View Full Content", key=f"view_{view_key}",
+                  on_click=st.session_state.viewing_messages.add, args=(view_key,))
+    elif is_open:
+        st.button("Hide", key=f"hide_{view_key}",
+                  on_click=st.session_state.viewing_messages.discard, args=(view_key,))
+    
+    st.markdown("---")
+
 def show_history_page():
     st.title("📚 Chat History")
     
@@ -312,10 +598,9 @@ def show_history_page():
     with col1:
         st.markdown(f"**Total Messages: {len(st.session_state.chat_history)}**")
     with col2:
-        export_data = json.dumps(st.session_state.chat_history, indent=2)
         st.download_button(
             "⬇️ Export",
-            export_data,
+            chat_history_json(),
             file_name=f"writewise_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
             mime="application/json",
         )
@@ -324,41 +609,117 @@ def show_history_page():
             if st.checkbox("Confirm clear all history"):
                 clear_chat_history()
                 st.success("Chat history cleared!")
-                st.rerun()
     
     st.markdown("---")
     
-    # Display chat history
-    for idx, msg in enumerate(st.session_state.chat_history):
-        role = msg.get("role", "assistant").lower()
-        content = msg.get("content", "")
-        timestamp = msg.get("timestamp")
-        
-        try:
-            msg_timestamp = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M") if timestamp else ""
-        except Exception:
-            msg_timestamp = ""
-        
-        if role == "user":
-            speaker = "🧑‍💻 You"
-            if msg_timestamp:
-                st.markdown(f"**{speaker}** ({msg_timestamp})")
-            else:
-                st.markdown(f"**{speaker}**")
-            st.info(content)
-        else:
-            speaker = "🤖 AI"
-            if msg_timestamp:
-                st.markdown(f"**{speaker}** ({msg_timestamp})")
-            else:
-                st.markdown(f"**{speaker}**")
-            st.success(content)
-        
-        st.markdown("---")
+    # Display the most recent messages first, one page at a time
+    history = st.session_state.chat_history
+    oldest_shown = max(len(history) - st.session_state.history_shown, 0)
+    for idx in range(len(history) - 1, oldest_shown - 1, -1):
+        _render_history_message(history[idx])
+    
+    remaining = len(history) - st.session_state.history_shown
+    if remaining > 0:
+        if st.button(f"Show more ({remaining} older)", key="history_show_more"):
+            st.session_state.history_shown += HISTORY_PAGE_SIZE
+            st.rerun()
 
 # ------------------------------
 # Template Builder
 # ------------------------------
+def _load_structure_into_generator(template_label: str, sections: List[str], *, main_topic: Optional[str] = None, description: str = "") -> None:
+    """Persist the selected structure and cue the user to generate content."""
+    st.session_state.selected_template = template_label or "Custom Structure"
+    st.session_state.custom_sections = sections.copy()
+    # Rendered once here; the generator shows it on every rerun while this structure is loaded
+    st.session_state.sections_markdown = (
+        st.session_state.custom_sections, _numbered_markdown(st.session_state.custom_sections)
+    )
+    st.session_state.main_topic = main_topic or template_label or "Custom Structure"
+    st.session_state.additional_context = description
+    st.session_state.section_results = {}
+    st.session_state.structure_selection_message = (
+        f"Structure '{st.session_state.selected_template}' selected. Open the Generator tab to start creating content."
+    )
+    st.session_state.structured_prompt_input = ""
+    st.rerun()
+
+@st.fragment
+def _render_template_card(template: dict) -> None:
+    """Render one saved template; its widgets rerun only this card."""
+    template_id = template.get("template_id", "")
+    template_name = template.get("template_name", "Untitled")
+    description = template.get("description", "")
+    sections = template.get("sections", [])
+    last_updated = template.get("updated_at_str")
+    if last_updated is None:
+        last_updated = template["updated_at_str"] = _format_timestamp(template.get("updated_at"), TEMPLATE_TIME_FORMAT)
+            
+    with st.expander(f"📋 {template_name}"):
+        if description:
+            st.markdown(f"**Description:** {description}")
+        if last_updated:
+            st.caption(f"Last updated: {last_updated}")
+                
+        st.markdown(f"**Sections ({len(sections)}):**")
+        st.markdown(_numbered_markdown(sections))
+                
+        # Serialized only when the button is clicked, not for every card on every rerun
+        download_payload = functools.partial(_dumps, template, indent=True)
+        action_cols = st.columns(3)
+                
+        with action_cols[0]:
+            if st.button(f"✅ Use Template", key=f"use_template_{template_id}"):
+                _load_structure_into_generator(template_name, sections, main_topic=template_name, description=description)
+                
+        with action_cols[1]:
+            st.download_button(
+                "⬇️ Download",
+                download_payload,
+                file_name=f"writewise_template_{template_name.replace(' ', '_').lower() or 'template'}.json",
+                mime="application/json",
+                key=f"download_template_{template_id}"
+            )
+                
+        with action_cols[2]:
+            if st.button(f"🗑️ Delete", key=f"delete_template_{template_id}"):
+                if delete_template(template_id):
+                    st.success(f"Template '{template_name}' deleted!")
+                    st.rerun()
+                else:
+                    st.error("Failed to delete template")
+                
+        # Edit template
+        with st.expander("✏️ Edit Template", expanded=False):
+            sections_text = "\n".join(sections)
+            with st.form(f"edit_template_form_{template_id}"):
+                new_name = st.text_input("Template Name", value=template_name)
+                new_description = st.text_area("Description", value=description or "", height=100)
+                new_sections_raw = st.text_area(
+                    "Sections (one per line)",
+                    value=sections_text,
+                    height=160
+                )
+                submitted = st.form_submit_button("Save Changes")
+                if submitted:
+                    new_sections = [line.strip() for line in new_sections_raw.splitlines() if line.strip()]
+                    if not new_name.strip():
+                        st.error("Template name is required.")
+                    elif not new_sections:
+                        st.error("Please provide at least one section.")
+                    else:
+                        success, message = update_template(
+                            template_id=template_id,
+                            template_name=new_name.strip(),
+                            sections=new_sections,
+                            description=new_description.strip(),
+                        )
+                        if success:
+                            st.success(message)
+                            st.rerun()
+                        else:
+                            st.error(message)
+
 def show_template_page():
     st.title("📋 Structure Builder")
     st.markdown("Define your document structure and let AI generate content for each section!")
@@ -366,30 +727,17 @@ def show_template_page():
     if st.session_state.structure_selection_message:
         st.success(st.session_state.structure_selection_message)
     
-    def _load_structure_into_generator(template_label: str, sections: List[str], *, main_topic: Optional[str] = None, description: str = "") -> None:
-        """Persist the selected structure and cue the user to generate content."""
-        st.session_state.selected_template = template_label or "Custom Structure"
-        st.session_state.custom_sections = sections.copy()
-        st.session_state.main_topic = main_topic or template_label or "Custom Structure"
-        st.session_state.additional_context = description
-        st.session_state.section_results = {}
-        st.session_state.structure_selection_message = (
-            f"Structure '{st.session_state.selected_template}' selected. Open the Generator tab to start creating content."
-        )
-        st.session_state.structured_prompt_input = ""
-        st.rerun()
-    
     tab1, tab2, tab3 = st.tabs(["Use Example Structures", "Create Custom Structure", "My Saved Templates"])
     
     with tab1:
         st.subheader("Pre-built Structure Templates")
         st.info("💡 Select a template to see example sections, then customize or use as-is")
         
+        rendered_structures = _rendered_example_structures()
         for structure_name, sections in EXAMPLE_STRUCTURES.items():
             with st.expander(f"📄 {structure_name}"):
                 st.markdown("**Sections:**")
-                for i, section in enumerate(sections, 1):
-                    st.markdown(f"{i}. {section}")
+                st.markdown(rendered_structures[structure_name])
                 
                 if st.button(f"Open \"{structure_name}\" in Generator", key=f"open_{structure_name}"):
                     _load_structure_into_generator(structure_name, sections, main_topic=structure_name)
@@ -425,27 +773,25 @@ def show_template_page():
         
         # Section input
         st.markdown("### Define Each Section:")
-        custom_sections = []
-        
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            st.markdown("**Section Name**")
-        with col2:
-            st.markdown("**Order**")
-        
-        for i in range(int(num_sections)):
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                section_name = st.text_input(
-                    f"Section {i+1}",
-                    placeholder=f"e.g., Introduction, Methodology, Results...",
-                    key=f"section_{i}",
-                    label_visibility="collapsed"
-                )
-                if section_name.strip():
-                    custom_sections.append(section_name.strip())
-            with col2:
-                st.text(f"{i+1}")
+        section_rows = int(num_sections)
+        # One editor widget for all sections instead of a row of columns and inputs per section
+        section_df = st.data_editor(
+            pd.DataFrame(
+                {"Section Name": [""] * section_rows},
+                index=pd.RangeIndex(1, section_rows + 1, name="Order"),
+            ),
+            num_rows="fixed",
+            use_container_width=True,
+            column_config={
+                "Section Name": st.column_config.TextColumn(
+                    help="e.g., Introduction, Methodology, Results...",
+                ),
+            },
+            key=f"sections_editor_{section_rows}",
+        )
+        custom_sections = [
+            name.strip() for name in section_df["Section Name"] if isinstance(name, str) and name.strip()
+        ]
         
         # Preview
         if custom_sections:
@@ -456,8 +802,7 @@ def show_template_page():
             if description:
                 st.markdown(f"**Description:** {description}")
             st.markdown("**Sections:**")
-            for i, section in enumerate(custom_sections, 1):
-                st.markdown(f"{i}. {section}")
+            st.markdown(_numbered_markdown(custom_sections))
         
         # Save and use buttons
         st.markdown("---")
@@ -496,141 +841,32 @@ def show_template_page():
             if st.button("🔄 Refresh", key="template_refresh"):
                 st.rerun()
         
-        templates = list(st.session_state.templates.values())
-        
-        # Filter by search term
-        if search_term:
-            query = search_term.strip().lower()
-            templates = [
-                t for t in templates
-                if query in t.get("template_name", "").lower() or query in t.get("description", "").lower()
-            ]
+        templates = filtered_templates(search_term.strip().lower() if search_term else "")
         
         if not templates:
             st.info("No templates match the current filters.")
             return
         
-        # Sort by updated_at
-        templates.sort(key=lambda t: t.get("updated_at", 0), reverse=True)
-        
         st.markdown(f"**Found {len(templates)} template(s)**")
         st.markdown("---")
         
         # Display templates
         for template in templates:
-            template_id = template.get("template_id", "")
-            template_name = template.get("template_name", "Untitled")
-            description = template.get("description", "")
-            sections = template.get("sections", [])
-            updated_at = template.get("updated_at", 0)
-            
-            with st.expander(f"📋 {template_name}"):
-                if description:
-                    st.markdown(f"**Description:** {description}")
-                if updated_at:
-                    try:
-                        last_updated = datetime.fromtimestamp(updated_at).strftime("%Y-%m-%d %H:%M:%S")
-                        st.caption(f"Last updated: {last_updated}")
-                    except Exception:
-                        pass
-                
-                st.markdown(f"**Sections ({len(sections)}):**")
-                for i, section in enumerate(sections, 1):
-                    st.markdown(f"{i}. {section}")
-                
-                download_payload = json.dumps(template, indent=2)
-                action_cols = st.columns(3)
-                
-                with action_cols[0]:
-                    if st.button(f"✅ Use Template", key=f"use_template_{template_id}"):
-                        _load_structure_into_generator(template_name, sections, main_topic=template_name, description=description)
-                
-                with action_cols[1]:
-                    st.download_button(
-                        "⬇️ Download",
-                        download_payload,
-                        file_name=f"writewise_template_{template_name.replace(' ', '_').lower() or 'template'}.json",
-                        mime="application/json",
-                        key=f"download_template_{template_id}"
-                    )
-                
-                with action_cols[2]:
-                    if st.button(f"🗑️ Delete", key=f"delete_template_{template_id}"):
-                        if delete_template(template_id):
-                            st.success(f"Template '{template_name}' deleted!")
-                            st.rerun()
-                        else:
-                            st.error("Failed to delete template")
-                
-                # Edit template
-                with st.expander("✏️ Edit Template", expanded=False):
-                    sections_text = "\n".join(sections)
-                    with st.form(f"edit_template_form_{template_id}"):
-                        new_name = st.text_input("Template Name", value=template_name)
-                        new_description = st.text_area("Description", value=description or "", height=100)
-                        new_sections_raw = st.text_area(
-                            "Sections (one per line)",
-                            value=sections_text,
-                            height=160
-                        )
-                        submitted = st.form_submit_button("Save Changes")
-                        if submitted:
-                            new_sections = [line.strip() for line in new_sections_raw.splitlines() if line.strip()]
-                            if not new_name.strip():
-                                st.error("Template name is required.")
-                            elif not new_sections:
-                                st.error("Please provide at least one section.")
-                            else:
-                                success, message = update_template(
-                                    template_id=template_id,
-                                    template_name=new_name.strip(),
-                                    sections=new_sections,
-                                    description=new_description.strip(),
-                                )
-                                if success:
-                                    st.success(message)
-                                    st.rerun()
-                                else:
-                                    st.error(message)
+            _render_template_card(template)
 
 # ------------------------------
 # Main Generator Page
 # ------------------------------
-def show_generator_page():
-    st.title("Write Wise - AI Content Generator")
-    st.subheader("Generate high-quality content from your prompts!")
-    
-    # Show chat history count
-    col1, col2 = st.columns([3, 1])
-    with col1:
-        message_count = len(st.session_state.chat_history)
-        st.caption(f"� Chat messages: {message_count}")
-    with col2:
-        if st.button("🗑️ Clear Chat"):
-            if message_count > 0:
-                clear_chat_history()
-                st.success("Chat cleared!")
-                st.rerun()
-    
-    # Template selection
-    if st.session_state.selected_template:
-        st.success(f"✅ Using structure: {st.session_state.selected_template}")
-        if st.button("❌ Clear Structure"):
-            st.session_state.selected_template = None
-            st.session_state.custom_sections = None
-            st.session_state.main_topic = None
-            st.session_state.additional_context = None
-            st.session_state.structure_selection_message = None
-            st.session_state.pop("structured_prompt_input", None)
-            st.rerun()
-    
+@st.fragment
+def _generator_form() -> None:
+    """Prompt inputs, generation options and results; typing here reruns only this fragment."""
     # Structure-based input
-    if st.session_state.selected_template and hasattr(st.session_state, 'custom_sections') and st.session_state.custom_sections:
+    if st.session_state.selected_template and st.session_state.get('custom_sections'):
         st.markdown("---")
         st.markdown("### 📋 Document Structure")
         
         # Show main topic
-        if hasattr(st.session_state, 'main_topic') and st.session_state.main_topic:
+        if st.session_state.get('main_topic'):
             st.markdown(f"**Topic:** {st.session_state.main_topic}")
             main_topic = st.session_state.main_topic
         else:
@@ -639,11 +875,14 @@ def show_generator_page():
         # Show structure
         st.markdown("**Sections to be generated:**")
         sections = st.session_state.custom_sections
-        for i, section in enumerate(sections, 1):
-            st.markdown(f"{i}. {section}")
+        rendered = st.session_state.get("sections_markdown")
+        # The identity check falls back to rendering when the sections were set some other way
+        if not rendered or rendered[0] is not sections:
+            rendered = st.session_state.sections_markdown = (sections, _numbered_markdown(sections))
+        st.markdown(rendered[1])
         
         # Additional context
-        if hasattr(st.session_state, 'additional_context') and st.session_state.additional_context:
+        if st.session_state.get('additional_context'):
             st.markdown(f"**Additional Context:** {st.session_state.additional_context}")
             additional_context = st.session_state.additional_context
         else:
@@ -662,29 +901,13 @@ def show_generator_page():
         )
         
         # Build structured prompt
-        user_prompt = f"Topic: {main_topic}\n\n"
-        if custom_prompt_input:
-            user_prompt += f"Prompt: {custom_prompt_input}\n\n"
-        if additional_context:
-            user_prompt += f"Context: {additional_context}\n\n"
-        user_prompt += "Please generate comprehensive content for the following document structure:\n\n"
-        for i, section in enumerate(sections, 1):
-            user_prompt += f"{i}. {section}\n"
+        user_prompt = build_structured_prompt(main_topic, tuple(sections), additional_context, custom_prompt_input)
         
         st.markdown("---")
         with st.expander("👁️ View Generated Prompt"):
             st.code(user_prompt)
         
-        base_system_instruction = f"""You are a professional content generator. Generate a comprehensive, well-structured document based on the provided structure.
-
-For each section:
-- Write detailed, relevant content specific to that section
-- Maintain consistency in tone and style throughout
-- Use proper formatting with clear headings
-- Include examples, data, or explanations as appropriate for each section
-- Ensure smooth transitions between sections
-
-Format your response with clear section headers (use ## for section titles) so each part is easily identifiable."""
+        base_system_instruction = STRUCTURED_SYSTEM_INSTRUCTION
         
         # Option to generate all sections or one at a time
         generation_mode = st.radio(
@@ -698,12 +921,11 @@ Format your response with clear section headers (use ## for section titles) so e
     else:
         # Standard prompt input
         user_prompt = st.text_area("Enter your prompt:", height=150, key="main_prompt")
-        base_system_instruction = "You are AiGuru, a professional AI content generator."
+        base_system_instruction = DEFAULT_SYSTEM_INSTRUCTION
         st.session_state.generation_mode = None
     
     # Model selection
-    if "model_choice" not in st.session_state:
-        st.session_state.model_choice = "gemini-2.5-flash"
+    st.session_state.setdefault("model_choice", "gemini-2.5-flash")
     
     col1, col2 = st.columns(2)
     with col1:
@@ -717,51 +939,128 @@ Format your response with clear section headers (use ## for section titles) so e
     with col2:
         depth_choice = st.selectbox(
             "Content Depth:",
-            [
-                "Shallow (high-level overview)",
-                "Medium (moderate detail with examples)",
-                "Deep (very detailed, nuanced, in-depth analysis)"
-            ],
+            DEPTH_CHOICES,
             index=1
         )
     
     # Tone selection
     tone_choice = st.selectbox(
         "🎭 Choose Tone/Theme:",
-        list(TONE_PRESETS.keys()),
+        TONE_CHOICES,
         help="Select the tone and style for your content"
     )
     
     # Format selection
     format_choice = st.selectbox(
         "📐 Output Format:",
-        list(FORMAT_OPTIONS.keys()),
+        FORMAT_CHOICES,
         index=3,  # Default to "Mixed"
         help="Choose how you want the content structured"
     )
     
-    # Map depth to instructions
-    depth_instruction_map = {
-        "Shallow (high-level overview)": "Provide a clear and simple overview. Focus on key points, avoid unnecessary details.",
-        "Medium (moderate detail with examples)": "Provide a moderately detailed explanation with examples and supporting points.",
-        "Deep (very detailed, nuanced, in-depth analysis)": "Provide an in-depth, thorough, and nuanced explanation. Include examples, multiple perspectives, reasoning, and insights."
-    }
-    
-    depth_instruction = depth_instruction_map[depth_choice]
-    tone_instruction = TONE_PRESETS[tone_choice]
-    format_instruction = FORMAT_OPTIONS[format_choice]
-    
     # Generate button
     if st.session_state.generation_mode == "Generate Sections One by One":
         st.markdown("---")
         st.markdown("### Generate Sections")
         
-        # Initialize section results storage
-        if "section_results" not in st.session_state:
-            st.session_state.section_results = {}
-        
         # Generate individual sections
         sections = st.session_state.custom_sections
+        section_results = st.session_state.section_results
+        
+        # The inputs shared by every section are read once, outside the per-section loop
+        main_topic = st.session_state.get('main_topic', '')
+        additional_context = st.session_state.get('additional_context', '')
+        custom_prompt_input = st.session_state.get('structured_prompt_input', '')
+        
+        if not additional_context:
+            additional_context = st.session_state.get('context_input', '')
+        
+        if custom_prompt_input:
+            user_requirements = f"User Requirements/Prompt: {custom_prompt_input}\n\n"
+        else:
+            user_requirements = ""
+        
+        # Everything shared by the document's sections comes first, so successive section
+        # requests open with an identical prefix the model's implicit prompt caching can reuse
+        section_prompt_prefix = (
+            f"Topic: {main_topic}\n\n"
+            f"{user_requirements}"
+            f"Context: {additional_context}\n\n"
+        )
+        
+        # The system prompts and models are the same for every section
+        section_system_prompt = build_system_prompt(
+            base_system_instruction, depth_choice, tone_choice, format_choice, SECTION_TASK
+        )
+        section_model = get_model(model_choice, section_system_prompt)
+        grouped_model = get_model(model_choice, build_system_prompt(
+            base_system_instruction, depth_choice, tone_choice, format_choice, GROUPED_SECTION_TASK
+        ))
+        
+        def section_prompt_for(section: str) -> str:
+            return (
+                section_prompt_prefix
+                + f"Section to generate: {section}\n\n"
+                "Please generate detailed, comprehensive content specifically for this section. "
+                "Ensure the response reflects the user's requirements and stays tightly aligned with the section focus."
+            )
+        
+        def grouped_section_prompt(group: tuple) -> str:
+            listing = "".join(f"{i}. {section}\n" for i, section in enumerate(group, 1))
+            return (
+                section_prompt_prefix
+                + f"Sections to generate:\n{listing}\n"
+                "Please generate detailed, comprehensive content for each of these sections. "
+                "Ensure each response reflects the user's requirements and stays tightly aligned with its section focus.\n\n"
+                f"Write each section as its own block: start it with a line `<<<SECTION: name>>>` using the "
+                f"section name exactly as listed, end it with a line `{SECTION_END}`, and write nothing outside the blocks."
+            )
+        
+        # Fan the sections still missing out to Gemini at once; the calls are network-bound.
+        # Sections share one call per group so the topic and context are sent once per group.
+        pending_sections = [section for section in sections if section not in section_results]
+        if st.button("⚡ Generate All Sections in Parallel", key="gen_all_sections", disabled=not pending_sections):
+            with st.spinner(f"Generating {len(pending_sections)} sections..."):
+                groups = [
+                    tuple(pending_sections[start:start + SECTIONS_PER_CALL])
+                    for start in range(0, len(pending_sections), SECTIONS_PER_CALL)
+                ]
+                grouped_outputs = asyncio.run_coroutine_threadsafe(
+                    _generate_sections_async(
+                        grouped_model, {group: grouped_section_prompt(group) for group in groups}, max_output_tokens=20000
+                    ),
+                    _async_loop(),
+                ).result()
+                unparsed_sections = []
+                for group, output_text in grouped_outputs.items():
+                    blocks = {} if isinstance(output_text, Exception) else split_sections(output_text)
+                    for section in group:
+                        if section in blocks:
+                            section_results[section] = blocks[section]
+                        else:
+                            unparsed_sections.append(section)
+                # Only the sections whose blocks didn't come back get a call of their own
+                outputs = asyncio.run_coroutine_threadsafe(
+                    _generate_sections_async(
+                        section_model, {section: section_prompt_for(section) for section in unparsed_sections}
+                    ),
+                    _async_loop(),
+                ).result() if unparsed_sections else {}
+            failures = []
+            for section, output_text in outputs.items():
+                if isinstance(output_text, Exception):
+                    failures.append(f"Error generating {section}: {output_text}")
+                elif output_text.strip():
+                    section_results[section] = output_text
+                else:
+                    failures.append(f"Failed to generate {section}")
+            # Report the whole batch in one message each way rather than one element per section
+            generated = [section for section in pending_sections if section in section_results]
+            if generated:
+                st.success("✅ Generated: " + ", ".join(generated))
+            if failures:
+                st.error("\n\n".join(failures))
+        
         for i, section in enumerate(sections, 1):
             col1, col2, col3 = st.columns([2, 1, 1])
             with col1:
@@ -769,71 +1068,32 @@ Format your response with clear section headers (use ## for section titles) so e
             with col2:
                 generate_section = st.button(f"Generate", key=f"gen_section_{i}")
             with col3:
-                if section in st.session_state.section_results:
-                    st.success("✅ Done")
+                # A placeholder lets a section generated in this run show as done without a rerun
+                done_placeholder = st.empty()
+                if section in section_results:
+                    done_placeholder.success("✅ Done")
             
             if generate_section:
-                main_topic = st.session_state.get('main_topic', '')
-                additional_context = st.session_state.get('additional_context', '')
-                custom_prompt_input = st.session_state.get('structured_prompt_input', '')
-                
-                if not additional_context:
-                    additional_context = st.session_state.get('context_input', '')
-                
-                if custom_prompt_input:
-                    user_requirements = f"User Requirements/Prompt: {custom_prompt_input}\n\n"
-                else:
-                    user_requirements = ""
-                
-                section_prompt = (
-                    f"Topic: {main_topic}\n\n"
-                    f"{user_requirements}"
-                    f"Section to generate: {section}\n\n"
-                    f"Context: {additional_context}\n\n"
-                    "Please generate detailed, comprehensive content specifically for this section. "
-                    "Ensure the response reflects the user's requirements and stays tightly aligned with the section focus."
-                )
+                section_prompt = section_prompt_for(section)
                 
                 with st.spinner(f"Generating {section}..."):
                     try:
-                        system_prompt = f"""
-{base_system_instruction}
-
-CONTENT DEPTH: {depth_instruction}
-TONE & STYLE: {tone_instruction}
-OUTPUT FORMAT: {format_instruction}
-
-Generate high-quality content for this specific section. Focus on relevance, clarity, and completeness.
-"""
-                        model = genai.GenerativeModel(
-                            model_name=model_choice,
-                            system_instruction=system_prompt
-                        )
-                        
-                        response = model.generate_content(
+                        response = section_model.generate_content(
                             section_prompt,
                             generation_config={
                                 "max_output_tokens": 8000,
                                 "temperature": 0.35
                             },
+                            stream=True,
                         )
                         
-                        # Extract text
-                        output_text = ""
-                        if hasattr(response, "candidates") and response.candidates:
-                            for candidate in response.candidates:
-                                content = getattr(candidate, "content", None)
-                                if content and getattr(content, "parts", None):
-                                    for part in content.parts:
-                                        output_text += getattr(part, "text", "")
-                        
-                        if not output_text and getattr(response, "text", None):
-                            output_text = response.text
+                        # Render the section while it streams in
+                        output_text = stream_markdown(response, st.empty())
                         
                         if output_text.strip():
-                            st.session_state.section_results[section] = output_text
+                            section_results[section] = output_text
+                            done_placeholder.success("✅ Done")
                             st.success(f"✅ {section} generated!")
-                            st.markdown(output_text)
                         else:
                             st.error(f"Failed to generate {section}")
                     
@@ -841,22 +1101,20 @@ Generate high-quality content for this specific section. Focus on relevance, cla
                         st.error(f"Error generating {section}: {e}")
             
             # Show existing content if available
-            elif section in st.session_state.section_results:
+            elif section in section_results:
                 with st.expander(f"View {section} content"):
-                    st.markdown(st.session_state.section_results[section])
+                    st.markdown(section_results[section])
         
         # Compile all sections button
         st.markdown("---")
-        if len(st.session_state.section_results) > 0:
+        if section_results:
             if st.button("📄 Compile All Sections into Final Document", type="primary"):
-                final_document = f"# {st.session_state.get('main_topic', 'Document')}\n\n"
-                
-                for i, section in enumerate(sections, 1):
-                    if section in st.session_state.section_results:
-                        final_document += f"## {i}. {section}\n\n"
-                        final_document += st.session_state.section_results[section] + "\n\n"
-                    else:
-                        final_document += f"## {i}. {section}\n\n[Content not generated yet]\n\n"
+                final_document = compile_document(
+                    main_topic or 'Document',
+                    tuple(sections),
+                    tuple(sorted(section_results.items())),
+                )
+                st.session_state.last_output_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                 
                 st.markdown("---")
                 st.markdown("### 📄 Complete Document")
@@ -866,14 +1124,14 @@ Generate high-quality content for this specific section. Focus on relevance, cla
                 save_message(
                     "assistant",
                     final_document,
-                    metadata={"title": f"{st.session_state.get('main_topic', 'Document')} - Compiled"}
+                    metadata={"title": f"{main_topic or 'Document'} - Compiled"}
                 )
                 
                 # Download option
                 st.download_button(
                     "📥 Download Complete Document",
                     final_document,
-                    file_name=f"{st.session_state.get('main_topic', 'document').replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
+                    file_name=f"{(main_topic or 'document').replace(' ', '_')}_{st.session_state.last_output_timestamp}.md",
                     mime="text/markdown",
                 )
                 
@@ -902,42 +1160,24 @@ Generate high-quality content for this specific section. Focus on relevance, cla
                     )
                     
                     # Build comprehensive system prompt
-                    system_prompt = f"""
-{base_system_instruction}
-
-CONTENT DEPTH: {depth_instruction}
-TONE & STYLE: {tone_instruction}
-OUTPUT FORMAT: {format_instruction}
-
-Your task is to generate high-quality content based on the user's prompt.
-Use proper grammar and structure, adapt tone appropriately, include headings or examples if needed, and avoid filler or repetition.
-"""
-                    
-                    model = genai.GenerativeModel(
-                        model_name=model_choice,
-                        system_instruction=system_prompt
+                    system_prompt = build_system_prompt(
+                        base_system_instruction, depth_choice, tone_choice, format_choice, DOCUMENT_TASK
                     )
+                    model = get_model(model_choice, system_prompt)
                     
-                    # Generate content
+                    # Generate content, rendering it as it streams in
                     response = model.generate_content(
                         user_prompt,
                         generation_config={
                             "max_output_tokens": 20000,
                             "temperature": 0.35
                         },
+                        stream=True,
                     )
                     
-                    # Extract text
-                    output_text = ""
-                    if hasattr(response, "candidates") and response.candidates:
-                        for candidate in response.candidates:
-                            content = getattr(candidate, "content", None)
-                            if content and getattr(content, "parts", None):
-                                for part in content.parts:
-                                    output_text += getattr(part, "text", "")
-                    
-                    if not output_text and getattr(response, "text", None):
-                        output_text = response.text
+                    st.markdown("---")
+                    output_placeholder = st.empty()
+                    output_text = stream_markdown(response, output_placeholder)
                     
                     # Display results
                     if output_text.strip():
@@ -951,12 +1191,11 @@ Use proper grammar and structure, adapt tone appropriately, include headings or
                         st.success("✅ Content Generated Successfully!")
                         
                         # Calculate generation time
-                        elapsed_time = (datetime.now() - start_time).total_seconds()
+                        finished_at = datetime.now()
+                        elapsed_time = (finished_at - start_time).total_seconds()
+                        st.session_state.last_output_timestamp = finished_at.strftime('%Y%m%d_%H%M%S')
                         st.caption(f"⏱️ Generated in {elapsed_time:.2f} seconds")
                         
-                        st.markdown("---")
-                        st.markdown(output_text)
-                        
                         # Download options
                         st.markdown("---")
                         download_col, info_col = st.columns([2, 3])
@@ -964,7 +1203,7 @@ Use proper grammar and structure, adapt tone appropriately, include headings or
                             st.download_button(
                                 "📥 Download as Text",
                                 output_text,
-                                file_name=f"writewise_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                                file_name=f"writewise_{st.session_state.last_output_timestamp}.txt",
                                 mime="text/plain",
                             )
                         with info_col:
@@ -974,6 +1213,39 @@ Use proper grammar and structure, adapt tone appropriately, include headings or
                 
                 except Exception as e:
                     st.error(f"❌ Error generating content: {e}")
+    
+    # A fragment rerun skips the end of the script, so write new messages here
+    flush_local_storage()
+
+def show_generator_page():
+    st.title("Write Wise - AI Content Generator")
+    st.subheader("Generate high-quality content from your prompts!")
+    
+    # Show chat history count
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        message_count = len(st.session_state.chat_history)
+        st.caption(f"� Chat messages: {message_count}")
+    with col2:
+        if st.button("🗑️ Clear Chat"):
+            if message_count > 0:
+                clear_chat_history()
+                st.success("Chat cleared!")
+                st.rerun()
+    
+    # Template selection
+    if st.session_state.selected_template:
+        st.success(f"✅ Using structure: {st.session_state.selected_template}")
+        if st.button("❌ Clear Structure"):
+            st.session_state.selected_template = None
+            st.session_state.custom_sections = None
+            st.session_state.main_topic = None
+            st.session_state.additional_context = None
+            st.session_state.structure_selection_message = None
+            st.session_state.pop("structured_prompt_input", None)
+            st.rerun()
+    
+    _generator_form()
 
 # ------------------------------
 # Navigation & Main App
@@ -1004,6 +1276,9 @@ elif st.session_state.current_page == "history":
 elif st.session_state.current_page == "templates":
     show_template_page()
 
+# Write this run's new messages and template changes to localStorage
+flush_local_storage()
+
 # Footer
 st.markdown("---")
 st.caption("💡 Your data is stored locally in your browser")